@@ -4,13 +4,23 @@
 @description: methods for batch joining
 """
 
-import gzip
+from array import array
 import h5py  # type: ignore
+from joblib import Parallel, delayed  # type: ignore
+from kman.const import (
+    COUNT_LABELS,
+    PROGRESS_STEP,
+    VECTOR_COMPRESS_LEVEL,
+    VECTOR_FLUSH_SIZE,
+)
+from kman.io import GZIP_LEVELS, gzip_writer
+import logging
 import numpy as np  # type: ignore
 import os
+import pickle
 import tempfile
 from tqdm import tqdm  # type: ignore
-from typing import Dict, Set
+from typing import Dict, Iterator, Set, Tuple
 
 
 class AbundanceVectorBase(object):
@@ -20,12 +30,19 @@ class AbundanceVectorBase(object):
 
     Variables:
             _ks {set} -- sequence lengths
+            _labels {np.ndarray} -- preformatted count lines, by count
+            _compressLevel {int} -- gzip compression level of output files
     """
 
     _ks: Set[int] = set()
+    _labels = np.array([b"%d\n" % i for i in range(COUNT_LABELS)], dtype=object)
+    _compressLevel: int = VECTOR_COMPRESS_LEVEL
 
-    def __init__(self):
+    def __init__(self, compressLevel: int = VECTOR_COMPRESS_LEVEL):
         super().__init__()
+        assert compressLevel in GZIP_LEVELS, "compression level must be in [1, 9]."
+        self._ks = set()
+        self._compressLevel = compressLevel
 
     def check_length(self, k: int):
         """Check that sequence length is compatible.
@@ -53,6 +70,23 @@ class AbundanceVectorBase(object):
         """
         self.check_length(k)
 
+    def add_counts(self, ref, strand, positions, count, k, replace=False):
+        """Add the same occurrence count at multiple positions of the vector.
+
+        Arguments:
+                ref {str} -- reference record name
+                strand {str} -- strand type
+                positions {list} -- positions on ref:strand
+                count {int} -- occurrence count
+                k {int} -- sequence length
+
+        Keyword Arguments:
+                replace {bool} -- whether to allow for replacement of non-zero
+                                                  counts (default: {False})
+        """
+        for pos in positions:
+            self.add_count(ref, strand, pos, count, k, replace)
+
     def add_ref(self, ref, strand, size):
         """Add/resize reference:strand vector.
 
@@ -66,32 +100,117 @@ class AbundanceVectorBase(object):
         """
         pass
 
-    def write_to(self, dirpath):
+    def write_to(self, dirpath, threads=1):
         """Write AbundanceVectors to a folder.
 
         The extension is removed from dirpath before proceeding.
 
         Arguments:
                 dirpath {str} -- path to output directory.
+
+        Keyword Arguments:
+                threads {int} -- number of files written at a time (default: {1})
         """
         pass
 
+    @staticmethod
+    def _assert_free(ref, strand, positions, counts):
+        """Fail on the first count written over a non-zero one without replace.
+
+        Arguments:
+                ref {str} -- reference record name
+                strand {str} -- strand type
+                positions {np.ndarray} -- colliding positions, in call order
+                counts {list} -- counts written at positions
+        """
+        if 0 != len(positions):
+            assert_msg = "cannot update a non-zero count without replace."
+            assert_msg += " (%s, %s, %d, %d)" % (ref, strand, positions[0], counts[0])
+            assert False, assert_msg
+
+    def _merge_entries(self, ref, strand, positions, counts, replace, read):
+        """Check count entries, and find the last count of each position.
+
+        Entries are applied in order, as with add_count: each count without
+        replace must find a zero count, i.e., the one of the previous entry at
+        the same position, or the stored one.
+
+        Arguments:
+                ref {str} -- reference record name
+                strand {str} -- strand type
+                positions {np.ndarray} -- entry positions
+                counts {np.ndarray} -- entry counts
+                replace {np.ndarray} -- entry replace flags
+                read {function} -- reads the stored counts at sorted positions
+
+        Returns:
+                tuple -- sorted unique positions, and their last counts
+        """
+        order = np.argsort(positions, kind="stable")
+        sortedPositions, sortedCounts = positions[order], counts[order]
+        first = np.ones(order.shape[0], dtype=bool)
+        first[1:] = sortedPositions[1:] != sortedPositions[:-1]
+        unique = sortedPositions[first]
+
+        previous = np.roll(sortedCounts, 1)
+        previous[first] = read(unique)
+        taken = np.sort(order[(0 != previous) & ~replace[order]])
+        self._assert_free(ref, strand, positions[taken], counts[taken])
+
+        last = np.append(first[1:], True)
+        return unique, sortedCounts[last]
+
+    def _write_counts(self, path, counts, desc=None):
+        """Write counts to a gzipped text file, one per line.
+
+        Counts are formatted and compressed PROGRESS_STEP at a time, instead
+        of one by one. Chunks of counts lower than COUNT_LABELS are formatted
+        by indexing a table of preformatted lines, without converting every
+        count to a string. Compression runs in parallel, in a separate process,
+        when pigz is available (see kman.io.gzip_writer).
+
+        Arguments:
+                path {str} -- path to output file
+                counts {np.ndarray} -- counts (or any array-like with slicing)
+
+        Keyword Arguments:
+                desc {str} -- progress bar description (default: {None})
+        """
+        with gzip_writer(path, self._compressLevel) as OH:
+            OH.write(b"# k=%d\n" % list(self._ks)[0])
+            with tqdm(total=counts.shape[0], desc=desc) as pbar:
+                for i in range(0, counts.shape[0], PROGRESS_STEP):
+                    chunk = np.asarray(counts[i : i + PROGRESS_STEP])
+                    if 0 <= chunk.min() and chunk.max() < COUNT_LABELS:
+                        OH.write(b"".join(self._labels[chunk].tolist()))
+                    else:
+                        lines = map(str, chunk.astype(np.int64).tolist())
+                        OH.write(("\n".join(lines) + "\n").encode())
+                    pbar.update(chunk.shape[0])
+
 
 class AbundanceVector(AbundanceVectorBase):
     """AbundanceVector system.
 
     For each records, for each strand, generates a 1-dimensional array with
-    abundance counts.
+    abundance counts. Vectors grow geometrically (at least doubling their
+    capacity) when a farther position is counted, instead of being resized
+    to every new position. Instances do not share any data, and can be
+    merged.
 
     Variables:
-            __data {dict} -- stores abundance vectores
+            __data {dict} -- stores abundance vectors, with spare capacity
+            __sizes {dict} -- abundance vector sizes
     """
 
-    """{ref:{strand:np.ndarray}}"""
-    __data: Dict[str, Dict[str, np.ndarray]] = {}
+    """{(ref, strand):np.ndarray}"""
+    __data: Dict[Tuple[str, str], np.ndarray]
+    __sizes: Dict[Tuple[str, str], int]
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, compressLevel: int = VECTOR_COMPRESS_LEVEL):
+        super().__init__(compressLevel)
+        self.__data = {}
+        self.__sizes = {}
 
     def add_count(self, ref, strand, pos, count, k, replace=False):
         """Add occurrence count to the vector.
@@ -108,12 +227,41 @@ class AbundanceVector(AbundanceVectorBase):
                                                   counts (default: {False})
         """
         super().add_count(ref, strand, pos, count, k, replace)
-        self.add_ref(ref, strand, pos + 1)
+        vector = self.add_ref(ref, strand, pos + 1)
         if not replace:
             assert_msg = "cannot update a non-zero count without replace."
             assert_msg += " (%s, %s, %d, %d)" % (ref, strand, pos, count)
-            assert self.__data[ref][strand][pos] == 0, assert_msg
-        self.__data[ref][strand][pos] = count
+            assert vector[pos] == 0, assert_msg
+        vector[pos] = count
+
+    def add_counts(self, ref, strand, positions, count, k, replace=False):
+        """Add the same occurrence count at multiple positions of the vector.
+
+        Equivalent to calling add_count once per position, with a single
+        vectorized check and assignment.
+
+        Arguments:
+                ref {str} -- reference record name
+                strand {str} -- strand type
+                positions {list} -- positions on ref:strand
+                count {int} -- occurrence count
+                k {int} -- sequence length
+
+        Keyword Arguments:
+                replace {bool} -- whether to allow for replacement of non-zero
+                                                  counts (default: {False})
+        """
+        self.check_length(k)
+        positions = np.asarray(positions, dtype=np.int64)
+        vector = self.add_ref(ref, strand, positions.max() + 1)
+        if not replace:
+            taken = vector[positions] != 0
+            if 0 != count:
+                # A repeated position overwrites its own earlier count
+                order = np.argsort(positions, kind="stable")
+                taken[order[1:][positions[order[1:]] == positions[order[:-1]]]] = True
+            self._assert_free(ref, strand, positions[taken], [count])
+        vector[positions] = count
 
     def add_ref(self, ref, strand, size):
         """Add/resize reference:strand vector.
@@ -125,49 +273,249 @@ class AbundanceVector(AbundanceVectorBase):
                 ref {str} -- reference record name
                 strand {str} -- strand type
                 size {int} -- new size
+
+        Returns:
+                np.ndarray -- reference:strand vector, with spare capacity
+        """
+        key = (ref, strand)
+        vector = self.__data.get(key)
+        if vector is None:
+            vector = self.__data[key] = np.zeros(size, dtype=np.int32)
+            self.__sizes[key] = size
+        elif size > self.__sizes[key]:
+            self.__sizes[key] = size
+            if size > vector.shape[0]:
+                grown = np.zeros(max(size, 2 * vector.shape[0]), dtype=np.int32)
+                grown[: vector.shape[0]] = vector
+                vector = self.__data[key] = grown
+        return vector
+
+    def merge(self, other, replace=False):
+        """Merge the counts of another AbundanceVector into this one.
+
+        Allows for independent AbundanceVectors to be filled in parallel (e.g.,
+        one per thread, or one per reference) without any synchronization, and
+        merged at the end. Equivalent to adding the non-zero counts of other
+        with add_count.
+
+        Arguments:
+                other {AbundanceVector}
+
+        Keyword Arguments:
+                replace {bool} -- whether to allow for replacement of non-zero
+                                                  counts (default: {False})
+        """
+        assert isinstance(other, AbundanceVector)
+        for k in other._ks:
+            self.check_length(k)
+        for ref, strand in other.__data:
+            counts = other.mk_vector(ref, strand)
+            vector = self.add_ref(ref, strand, counts.shape[0])
+            positions = np.flatnonzero(counts)
+            if not replace:
+                taken = positions[vector[positions] != 0]
+                self._assert_free(ref, strand, taken, counts[taken])
+            vector[positions] = counts[positions]
+
+    def merge_stream(self, path):
+        """Merge the counts streamed to a file by an AbundanceVectorStream.
+
+        Equivalent to adding the streamed counts with add_count, in order.
+
+        Arguments:
+                path {str} -- path to AbundanceVectorStream file
+        """
+        for ref, strand, k, *entries in AbundanceVectorStream.read(path):
+            self.check_length(k)
+            vector = self.add_ref(ref, strand, entries[0].max() + 1)
+            unique, last = self._merge_entries(ref, strand, *entries, vector.take)
+            vector[unique] = last
+
+    def mk_vector(self, ref, strand):
+        """Get the reference:strand abundance vector, without spare capacity.
+
+        Arguments:
+                ref {str} -- reference record name
+                strand {str} -- strand type
+
+        Returns:
+                np.ndarray -- abundance vector
         """
-        if ref not in self.__data.keys():
-            self.__data[ref] = {}
-        if strand not in self.__data[ref].keys():
-            self.__data[ref][strand] = np.zeros(size)
-        elif size > self.__data[ref][strand].shape[0]:
-            self.__data[ref][strand].resize(size)
-
-    def write_to(self, dirpath):
+        return self.__data[(ref, strand)][: self.__sizes[(ref, strand)]]
+
+    def write_to(self, dirpath, threads=1):
         """Write AbundanceVectors to a folder.
 
-        The extension is removed from dirpath before proceeding.
+        The extension is removed from dirpath before proceeding. Each
+        reference:strand vector is written to its own file, and files are
+        written in parallel threads (compression releases the GIL).
 
         Arguments:
                 dirpath {str} -- path to output directory.
+
+        Keyword Arguments:
+                threads {int} -- number of files written at a time (default: {1})
         """
         dirpath = os.path.splitext(dirpath)[0]
         assert not os.path.isfile(dirpath)
-        print('Writing output in "%s"' % dirpath)
+        logging.info(f"Writing output in '{dirpath}'...")
         os.makedirs(dirpath, exist_ok=True)
-        for ref in self.__data.keys():
-            for strand in self.__data[ref].keys():
-                fname = "%s___%s.gz" % (ref, strand)
-                with gzip.open(os.path.join(dirpath, fname), "wb") as OH:
-                    OH.write(b"# k=%d\n" % list(self._ks)[0])
-                    for count in tqdm(self.__data[ref][strand], desc=fname):
-                        OH.write(b"%d\n" % count)
+        Parallel(n_jobs=threads, backend="threading")(
+            delayed(self.__write_ref)(dirpath, ref, strand)
+            for ref, strand in self.__data
+        )
+
+    def __write_ref(self, dirpath, ref, strand):
+        """Write a reference:strand AbundanceVector to a folder.
+
+        Arguments:
+                dirpath {str} -- path to output directory.
+                ref {str} -- reference record name
+                strand {str} -- strand type
+        """
+        fname = "%s___%s.gz" % (ref, strand)
+        self._write_counts(
+            os.path.join(dirpath, fname), self.mk_vector(ref, strand), fname
+        )
+
+
+class AbundanceVectorStream(AbundanceVectorBase):
+    """AbundanceVector system streaming counts to a file.
+
+    Counts are not stored, but buffered as (position, count, replace) entries
+    and appended to a file every VECTOR_FLUSH_SIZE counts. Allows for counts
+    to be collected in other processes without building dense vectors, and
+    merged with AbundanceVector.merge_stream.
+
+    Variables:
+            __path {str} -- path to output file
+            __buffers {dict} -- buffered positions, counts, and replace flags
+            __buffered {int} -- number of buffered counts
+    """
+
+    __path: str
+    __buffers: Dict[Tuple[str, str], Tuple[array, array, array]]
+    __buffered: int
+
+    def __init__(self, path: str, compressLevel: int = VECTOR_COMPRESS_LEVEL):
+        super().__init__(compressLevel)
+        self.__path = path
+        self.__buffers = {}
+        self.__buffered = 0
+        open(path, "wb").close()
+
+    @property
+    def path(self):
+        return self.__path
+
+    def add_count(self, ref, strand, pos, count, k, replace=False):
+        """Add occurrence count to the vector.
+
+        Arguments:
+                ref {str} -- reference record name
+                strand {str} -- strand type
+                pos {int} -- position on ref:strand
+                count {int} -- occurrence count
+                k {int} -- sequence length
+
+        Keyword Arguments:
+                replace {bool} -- whether to allow for replacement of non-zero
+                                                  counts (default: {False})
+        """
+        self.add_counts(ref, strand, [pos], count, k, replace)
+
+    def add_counts(self, ref, strand, positions, count, k, replace=False):
+        """Add the same occurrence count at multiple positions of the vector.
+
+        Arguments:
+                ref {str} -- reference record name
+                strand {str} -- strand type
+                positions {list} -- positions on ref:strand
+                count {int} -- occurrence count
+                k {int} -- sequence length
+
+        Keyword Arguments:
+                replace {bool} -- whether to allow for replacement of non-zero
+                                                  counts (default: {False})
+        """
+        self.check_length(k)
+        buffers = self.__buffers.get((ref, strand))
+        if buffers is None:
+            buffers = (array("q"), array("i"), array("b"))
+            self.__buffers[(ref, strand)] = buffers
+        buffers[0].extend(positions)
+        buffers[1].extend([count] * len(positions))
+        buffers[2].extend([replace] * len(positions))
+        self.__buffered += len(positions)
+        if self.__buffered >= VECTOR_FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Append the buffered counts to the file."""
+        buffers = self.__buffers
+        self.__buffers = {}
+        self.__buffered = 0
+        with open(self.__path, "ab") as OH:
+            for (ref, strand), (positions, counts, replace) in buffers.items():
+                entries = (ref, strand, list(self._ks)[0], positions, counts, replace)
+                pickle.dump(entries, OH, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def read(path: str) -> Iterator[Tuple]:
+        """Read the counts streamed to a file.
+
+        Arguments:
+                path {str} -- path to AbundanceVectorStream file
+
+        Yields:
+                tuple -- (ref, strand, k, positions, counts, replace), with
+                         positions, counts and replace as np.ndarray
+        """
+        with open(path, "rb") as IH:
+            while True:
+                try:
+                    ref, strand, k, positions, counts, replace = pickle.load(IH)
+                except EOFError:
+                    return
+                yield (
+                    ref,
+                    strand,
+                    k,
+                    np.frombuffer(positions, dtype=np.int64),
+                    np.frombuffer(counts, dtype=np.intc),
+                    np.frombuffer(replace, dtype=np.int8).astype(bool),
+                )
 
 
 class AbundanceVectorLocal(AbundanceVectorBase):
     """AbundanceVector system with local storage.
 
     Stores data in local binary file(s) instead of memory. Based on h5py.
+    Counts are buffered in memory as (position, count, replace) entries, and
+    flushed to the HDF5 files every VECTOR_FLUSH_SIZE counts (and before
+    writing), so that each file is opened once per flush instead of once per
+    count. Overwrites without replace are checked per entry when flushing,
+    as AbundanceVector does per call.
+
+    Variables:
+            __buffers {dict} -- buffered positions, counts, and replace flags
+            __buffered {int} -- number of buffered counts
+            _dataList {set} -- names of the HDF5 files
     """
 
     __tmpH = None
     _tmp = None
-    _dataList: Set[str] = set()
+    _dataList: Set[str]
+    __buffers: Dict[Tuple[str, str], Tuple[array, array, array]]
+    __buffered: int
 
-    def __init__(self):
-        super(AbundanceVectorLocal, self).__init__()
+    def __init__(self, compressLevel: int = VECTOR_COMPRESS_LEVEL):
+        super(AbundanceVectorLocal, self).__init__(compressLevel)
         self.__tmpH = tempfile.TemporaryDirectory(prefix="kmanVector")
         self._tmp = self.__tmpH.name
+        self._dataList = set()
+        self.__buffers = {}
+        self.__buffered = 0
 
     @property
     def tmp(self):
@@ -188,13 +536,51 @@ class AbundanceVectorLocal(AbundanceVectorBase):
                                                   counts (default: {False})
         """
         super().add_count(ref, strand, pos, count, k, replace)
-        self.add_ref(ref, strand, pos)
-        with h5py.File(self.refpath(ref, strand)) as DH:
-            if not replace:
-                assert_msg = "cannot update a non-zero count without replace."
-                assert_msg += " (%s, %s, %d, %d)" % (ref, strand, pos, count)
-                assert DH["abundances"][pos] == 0, assert_msg
-            DH["abundances"][pos] = count
+        buffers = self.__buffers.get((ref, strand))
+        if buffers is None:
+            buffers = (array("q"), array("i"), array("b"))
+            self.__buffers[(ref, strand)] = buffers
+        buffers[0].append(pos)
+        buffers[1].append(count)
+        buffers[2].append(replace)
+        self.__buffered += 1
+        if self.__buffered >= VECTOR_FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered counts to the HDF5 files."""
+        buffers = self.__buffers
+        self.__buffers = {}
+        self.__buffered = 0
+        for (ref, strand), (positions, counts, replace) in buffers.items():
+            self.__flush_ref(ref, strand, positions, counts, replace)
+
+    def __flush_ref(self, ref, strand, positions, counts, replace):
+        """Write buffered counts to a reference:strand HDF5 file.
+
+        Only the stored counts at the buffered positions are read and written
+        back, selecting the sorted unique positions. Each count without
+        replace must find a zero count: the one of the previous entry at the
+        same position, or the stored one.
+
+        Arguments:
+                ref {str} -- reference record name
+                strand {str} -- strand type
+                positions {array} -- buffered positions
+                counts {array} -- buffered counts
+                replace {array} -- buffered replace flags
+        """
+        positions = np.frombuffer(positions, dtype=np.int64)
+        counts = np.frombuffer(counts, dtype=np.intc)
+        replace = np.frombuffer(replace, dtype=np.int8).astype(bool)
+        self.add_ref(ref, strand, positions.max())
+
+        with h5py.File(self.refpath(ref, strand), "a") as DH:
+            data = DH["abundances"]
+            unique, last = self._merge_entries(
+                ref, strand, positions, counts, replace, data.__getitem__
+            )
+            data[unique] = last
 
     def add_ref(self, ref, strand, size):
         """Add/resize reference:strand vector.
@@ -210,7 +596,7 @@ class AbundanceVectorLocal(AbundanceVectorBase):
         if not self.has_ref(ref, strand):
             self.mk_ref_file(ref, strand, size)
         else:
-            with h5py.File(self.refpath(ref, strand)) as DH:
+            with h5py.File(self.refpath(ref, strand), "a") as DH:
                 if size + 1 > DH["abundances"].shape[0]:
                     DH["abundances"].resize((size + 1,))
 
@@ -229,30 +615,34 @@ class AbundanceVectorLocal(AbundanceVectorBase):
     def mk_ref_file(self, ref, strand, size):
         if not self.has_ref(ref, strand):
             self._dataList.add(self.refname(ref, strand))
-            with h5py.File(self.refpath(ref, strand)) as DH:
+            with h5py.File(self.refpath(ref, strand), "w") as DH:
                 data = DH.create_dataset(
                     "abundances", (size + 1,), dtype="i", maxshape=(None,), chunks=True
                 )
                 data[...] = np.zeros((size + 1,))
 
-    def write_to(self, dirpath):
+    def write_to(self, dirpath, threads=1):
         """Write AbundanceVectors to a folder.
 
-        The extension is removed from dirpath before proceeding.
+        The extension is removed from dirpath before proceeding. Files are
+        written one at a time, as HDF5 access is serialized anyway.
 
         Arguments:
                 dirpath {str} -- path to output directory.
+
+        Keyword Arguments:
+                threads {int} -- ignored (default: {1})
         """
         dirpath = os.path.splitext(dirpath)[0]
         assert not os.path.isfile(dirpath)
-        print('Writing output in "%s"' % dirpath)
+        logging.info(f"Writing output in '{dirpath}'...")
         os.makedirs(dirpath, exist_ok=True)
 
+        self.flush()
         for fname in self._dataList:
             fpath = os.path.join(self.tmp, fname)
-            with h5py.File(fpath) as DH:
+            with h5py.File(fpath, "r") as DH:
                 oname = "%s.gz" % os.path.splitext(fname)[0]
-                with gzip.open(os.path.join(dirpath, oname), "wb") as OH:
-                    OH.write(b"# k=%d\n" % list(self._ks)[0])
-                    for count in tqdm(DH["abundances"], desc=oname):
-                        OH.write(b"%d\n" % count)
+                self._write_counts(
+                    os.path.join(dirpath, oname), DH["abundances"], oname
+                )
@@ -5,9 +5,11 @@
 """
 
 from Bio.SeqIO.FastaIO import SimpleFastaParser  # type: ignore
-import gzip
+from itertools import islice
+from kman.const import JOIN_CHUNK_SIZE
 from kman.seq import KMer
-from kman.io import SmartFastaParser
+from kman.io import count_fasta_records, gzip_module, SmartFastaParser
+from operator import attrgetter
 import os
 import tempfile
 import time
@@ -18,8 +20,9 @@ class Batch(object):
     """Batch container.
 
     Records in the Batch are accessible through the record_gen and sorted
-    methods, which source either from memory or from written files. A Batch
-    cannot be resized. After full size is reached, a new Batch should be created
+    methods, which source either from memory or from written files, or as
+    (seq, header) tuples through tuple_gen. A Batch cannot be resized. After
+    full size is reached, a new Batch should be created.
 
     Variables:
             _fread {str} -- name of type method to read a record
@@ -29,7 +32,7 @@ class Batch(object):
             _written {bool} -- if the batch was written to file
             _i {number} -- current record location
             _tmp_dir {tempfile.TemporaryDirectory}
-            _tmp {tempfile.TemporaryFile}
+            _tmp {str} -- path to the temporary file, reserved on first access
             isFasta {bool} -- whether the output should be in fasta format
             suffix {str} -- extension for the output temporary file
     """
@@ -61,7 +64,7 @@ class Batch(object):
         self._remaining = self.__size
         self.__type = t
         self._tmp_dir = tmpDir
-        self.__records = [None] * self.__size
+        self.__records = None if self.is_written else [None] * self.__size
 
     @property
     def is_written(self):
@@ -81,7 +84,7 @@ class Batch(object):
 
     @property
     def collection(self):
-        if isinstance(self.__records, type(None)):
+        if self.__records is None:
             return None
         return self.__records.copy()
 
@@ -92,13 +95,10 @@ class Batch(object):
     @property
     def tmp(self):
         if self._tmp is None:
-            with tempfile.NamedTemporaryFile(
-                mode="w+",
-                dir=self._tmp_dir,
-                prefix=str(hash(time.time())),
-                suffix=self.suffix,
-            ) as TH:
-                self._tmp = TH.name
+            fd, self._tmp = tempfile.mkstemp(
+                dir=self._tmp_dir, prefix=str(hash(time.time())), suffix=self.suffix
+            )
+            os.close(fd)
         return self._tmp
 
     @property
@@ -151,40 +151,59 @@ class Batch(object):
                 generator
         """
         if self.isFasta:
-            return sorted(
-                self.record_gen(smart), key=lambda x: getattr(x, self.keyAttr)
-            )
+            return sorted(self.record_gen(smart), key=attrgetter(self.keyAttr))
         else:
             return sorted(self.record_gen(smart))
 
-    def _record_gen_from_handle(self, TH: IO, smart=False):
+    def _record_gen_from_handle(self, TH: IO, smart=False, fread=None):
+        fread = getattr(self.__type, self.fread if fread is None else fread)
         if self.isFasta:
             fasta_parser = SmartFastaParser.parse_file if smart else SimpleFastaParser
             for record in fasta_parser(TH):
-                yield getattr(self.__type, self.fread)(record)
+                yield fread(record)
         else:
             for line in TH:
-                yield getattr(self.__type, self.fread)(line)
+                yield fread(line)
 
-    def _record_gen_from_file(self, smart=False):
+    def _record_gen_from_file(self, smart=False, fread=None):
         """Generator of records, reading from file.
 
         Keyword Arguments:
                 smart {bool} -- use smarter IO (open only when needed) parser when
                                 available. Might cause higher overhead.
+                fread {str} -- name of type method to read a record, overrides
+                               self.fread (default: {None})
 
         Yields:
                 record
         """
         if self.tmp.endswith(".gz"):
-            TH = gzip.open(self.tmp, "rt")
+            TH = gzip_module.open(self.tmp, "rt")
         else:
-            TH = open(self.tmp, "r+")
-        for record in self._record_gen_from_handle(TH, smart):
+            TH = open(self.tmp, "r")
+        for record in self._record_gen_from_handle(TH, smart, fread):
             yield record
         if not TH.closed:
             TH.close()
 
+    def tuple_gen(self, smart=False):
+        """Generator of (seq, header) record tuples.
+
+        When reading from file and the record type provides a tuple_from_file
+        method, the tuples are built directly from the file content, skipping
+        the construction of record objects.
+
+        Keyword Arguments:
+                smart {bool} -- use smarter IO (open only when needed) parser when
+                                available. Might cause higher overhead.
+
+        Returns:
+                generator
+        """
+        if self.is_written and hasattr(self.type, "tuple_from_file"):
+            return self._record_gen_from_file(smart, "tuple_from_file")
+        return ((r.seq, r.header) for r in self.record_gen(smart))
+
     def record_gen(self, smart=False):
         """Generator of records.
 
@@ -199,14 +218,13 @@ class Batch(object):
             for record in self._record_gen_from_file(smart):
                 yield record
         else:
-            for record in self.__records:
-                if not type(None) == type(record):
-                    yield record
+            for record in self.__records[: self._i]:
+                yield record
 
     def check_record(self, record):
         """Check that record type matches the Batch."""
-        assert (
-            type(record) == self.type
+        assert isinstance(
+            record, self.type
         ), f"record must be {self.type}, not {type(record)}."
 
     def add(self, record):
@@ -219,8 +237,8 @@ class Batch(object):
         Arguments:
                 record -- record of the same type as self.type
         """
-        assert not self.is_full(), "this batch is full."
-        assert not self.is_written, "this batch has been stored locally."
+        assert 0 != self._remaining, "this batch is full."
+        assert not self._written, "this batch has been stored locally."
         self.check_record(record)
         self.__records[self._i] = record
         self._i += 1
@@ -244,18 +262,26 @@ class Batch(object):
                 doSort {bool} -- whether to sort when writing (default: {False})
         """
         if doSort:
-            return (
-                getattr(r, self.fwrite)()
-                for r in self.sorted()
-                if not type(None) == type(r)
-            )
+            return (getattr(r, self.fwrite)() for r in self.sorted() if r is not None)
         else:
             return (
-                getattr(r, self.fwrite)()
-                for r in self.record_gen()
-                if not type(None) == type(r)
+                getattr(r, self.fwrite)() for r in self.record_gen() if r is not None
             )
 
+    def _dump(self, doSort=False):
+        """Dump writeable records to the temporary file.
+
+        Records are fully materialized before opening the file, as they might
+        be sourced from the file itself. The chunks are then handed to a
+        single writelines call, without joining them into one large string.
+
+        Keyword Arguments:
+                doSort {bool} -- whether to sort when writing (default: {False})
+        """
+        output = [x if x.endswith("\n") else x + "\n" for x in self.to_write(doSort)]
+        with open(self.tmp, "w") as TH:
+            TH.writelines(output)
+
     def write(self, doSort=False, force=False):
         """Writes the batch to file.
 
@@ -265,11 +291,7 @@ class Batch(object):
                                 (default: {False})
         """
         if not self.is_written or force:
-            output = self.to_write(doSort)
-            output = [x + "\n" if not x.endswith("\n") else x for x in output]
-            output = "".join(output)
-            with open(self.tmp, "w+") as TH:
-                TH.write(output)
+            self._dump(doSort)
             self.__records = None
             self._written = True
 
@@ -291,21 +313,13 @@ class Batch(object):
         """
 
         if isFasta:
-            if path.endswith(".gz"):
-                FH = gzip.open(path, "rt")
-            else:
-                FH = open(path, "r+")
-
-            if smart:
-                size = max(2, sum(1 for record in SmartFastaParser(FH).parse()))
-            else:
-                size = max(2, sum(1 for record in SimpleFastaParser(FH)))
+            size = max(2, count_fasta_records(path))
         else:
-            FH = open(path, "r+")
-            size = max(2, sum(1 for line in FH))
+            with open(path, "r") as FH:
+                size = max(2, sum(1 for line in FH))
 
         batch = Batch(t, os.path.dirname(path), size)
-        batch._tmp = FH.name
+        batch._tmp = path
         batch._i = size
         batch._remaining = 0
         batch._written = True
@@ -314,7 +328,6 @@ class Batch(object):
         if reSort:
             batch.write(doSort=True, force=True)
 
-        FH.close()
         return batch
 
     @staticmethod
@@ -366,8 +379,13 @@ class BatchAppendable(Batch):
     Records in the Batch are accessible through the record_gen and sorted
     methods, which source either from memory or from written files. A Batch
     cannot be resized. After full size is reached, a new Batch should be created
+
+    Records are appended directly to the temporary file, so no in-memory
+    record collection is allocated, which keeps the Batch cheap to pickle.
     """
 
+    _written = True
+
     def __init__(self, t, tmpDir, size=1):
         """Initialize a Batch.
 
@@ -426,11 +444,37 @@ class BatchAppendable(Batch):
     def add_all(self, recordGen):
         """Adds all records from a generator to the current Batch.
 
+        Records are formatted and appended to the temporary file
+        JOIN_CHUNK_SIZE at a time, with a single writelines call per chunk
+        (see add_lines).
+
         Arguments:
                 recordGen {generator} -- record generator
         """
-        for record in recordGen:
-            self.add(record)
+        records = iter(recordGen)
+        for chunk in iter(lambda: list(islice(records, JOIN_CHUNK_SIZE)), []):
+            assert len(chunk) <= self.remaining, "this batch is full."
+            lines = []
+            for record in chunk:
+                super().check_record(record)
+                output = getattr(record, self.fwrite)()
+                lines.append(output if output.endswith("\n") else output + "\n")
+            self.add_lines(lines)
+
+    def add_lines(self, lines):
+        """Adds already formatted records to the current Batch.
+
+        Skips building record objects only to write them. Each line must be
+        formatted as by the self.fwrite method of the record type.
+
+        Arguments:
+                lines {list} -- newline-terminated text lines, one per record
+        """
+        assert len(lines) <= self.remaining, "this batch is full."
+        with open(self.tmp, "a") as OH:
+            OH.writelines(lines)
+        self._i += len(lines)
+        self._remaining -= len(lines)
 
     def write(self, doSort=False):
         """Writes the batch to file.
@@ -441,11 +485,7 @@ class BatchAppendable(Batch):
                 doSort {bool} -- whether to sort when writing (default: {False})
         """
         if doSort:
-            output = self.to_write(doSort)
-            output = [x + "\n" if not x.endswith("\n") else x for x in output]
-            output = "".join(output)
-            with open(self.tmp, "w+") as TH:
-                TH.write(output)
+            self._dump(doSort)
 
     @staticmethod
     def from_file(path, t=KMer, isFasta=True, smart=False):
@@ -464,26 +504,17 @@ class BatchAppendable(Batch):
         """
 
         if isFasta:
-            if path.endswith(".gz"):
-                FH = gzip.open(path, "rt")
-            else:
-                FH = open(path, "r+")
-
-            if smart:
-                size = max(2, sum(1 for record in SmartFastaParser(FH).parse()))
-            else:
-                size = max(2, sum(1 for record in SimpleFastaParser(FH)))
+            size = max(2, count_fasta_records(path))
         else:
-            FH = open(path, "r+")
-            size = max(2, sum(1 for line in FH))
+            with open(path, "r") as FH:
+                size = max(2, sum(1 for line in FH))
 
         batch = BatchAppendable(t, os.path.dirname(path), size)
-        batch._tmp = FH.name
+        batch._tmp = path
         batch._i = size
         batch._remaining = 0
         batch._written = True
 
-        FH.close()
         return batch
 
     @staticmethod
@@ -5,11 +5,11 @@
 """
 
 from enum import Enum
-import gzip
 import itertools
 from kman.batch import Batch
+from kman.const import PROGRESS_STEP
 from kman.seq import KMer, Sequence
-from kman.io import SmartFastaParser
+from kman.io import SmartFastaParser, open_fasta
 from joblib import Parallel, delayed  # type: ignore
 import logging
 import multiprocessing as mp
@@ -58,7 +58,7 @@ class BatcherBase(object):
         super().__init__()
         self.size = size
         self.natype = natype
-        if tempfile.TemporaryDirectory == type(tmp):
+        if isinstance(tmp, tempfile.TemporaryDirectory):
             self._tmpH = tmp
             self._tmp = tmp.name
         elif tmp is not None:
@@ -102,9 +102,14 @@ class BatcherBase(object):
         return self._tmp
 
     def new_batch(self):
-        """Add a new empty batch to the current collection."""
-        if self.collection[-1].is_full():
-            self.collection[-1].write()
+        """Add a new empty batch to the current collection.
+
+        A new batch is needed when the last one is full, or when it was already
+        written (e.g., fed from a parallel batcher). The last batch is sorted
+        while being written, so that it does not need to be re-read later.
+        """
+        if self.collection[-1].is_full() or self.collection[-1].is_written:
+            self.collection[-1].write(doSort=True)
             self._batches.append(Batch.from_batcher(self))
 
     def add_record(self, record):
@@ -119,13 +124,15 @@ class BatcherBase(object):
         self.new_batch()  # Add new batch if needed
         self.collection[-1].add(record)
 
-    def write_all(self, f="as_fasta", doSort=False, verbose=False):
+    def write_all(self, doSort=False, verbose=False):
         """Write all batches to file.
 
+        Records are formatted by the fwrite method of each Batch.
+
         Keyword Arguments:
-                f {str} -- name of method in records class for string-like
-                           representation (default: {"as_fasta"})
                 doSort {bool} -- whether to sort when writing (default: {False})
+                verbose {bool} -- whether to show a progress bar
+                                  (default: {False})
         """
         biList = range(len(self.collection))
         description = "Writing"
@@ -135,7 +142,7 @@ class BatcherBase(object):
             biList = tqdm(biList, desc=description)
         for bi in biList:
             if 0 != self.collection[bi].current_size:
-                self.collection[bi].write(f, doSort)
+                self.collection[bi].write(doSort)
 
 
 class BatcherThreading(BatcherBase):
@@ -191,6 +198,22 @@ class BatcherThreading(BatcherBase):
     def threads(self, t):
         self.__threads = max(1, min(t, mp.cpu_count()))
 
+    def write_all(self, doSort=False, verbose=False):
+        """Write all batches to file, in parallel.
+
+        Batches are written in place, hence a thread-based backend is used.
+
+        Keyword Arguments:
+                doSort {bool} -- whether to sort when writing (default: {False})
+                verbose {bool} -- whether to be verbose (default: {False})
+        """
+        if 1 == self.threads:
+            super().write_all(doSort, verbose)
+        else:
+            Parallel(
+                n_jobs=self.threads, backend="threading", verbose=11 if verbose else 0
+            )(delayed(b.write)(doSort) for b in self.collection if 0 != b.current_size)
+
     def __flow_batches(self, collection) -> None:
         for bi in tqdm(range(len(collection)), desc="Flowing"):
             batch = collection.pop()
@@ -210,7 +233,7 @@ class BatcherThreading(BatcherBase):
         Keyword Arguments:
                 mode {BatcherThreading.FEED_MODE} -- (default: {FEED_MODE.FLOW})
         """
-        assert all([b.type == self.type for b in new_collection])
+        assert all(b.type is self.type for b in new_collection)
         if mode == self.FEED_MODE.REPLACE:
             self._batches = new_collection
         elif mode == self.FEED_MODE.FLOW:
@@ -222,7 +245,8 @@ class BatcherThreading(BatcherBase):
     def from_files(dirPath, threads, t=KMer, isFasta=True, reSort=False):
         """Load batches from file.
 
-        Each file in the provided directory should be a written Batch.
+        Each file in the provided directory should be a written Batch. Loading
+        is dominated by file reading, hence it is parallelized over threads.
 
         Arguments:
                 dirPath {str} -- path to batch directory
@@ -236,18 +260,19 @@ class BatcherThreading(BatcherBase):
                 list -- list of Batches
         """
         assert os.path.isdir(dirPath)
-        threads = max(1, min(threads, mp.cpu_count()))
+        fnames = os.listdir(dirPath)
+        threads = max(1, min(threads, mp.cpu_count(), len(fnames)))
         if 1 == threads:
             return [
-                Batch.from_file(os.path.join(dirPath, fname), t, isFasta)
-                for fname in tqdm(os.listdir(dirPath))
+                Batch.from_file(os.path.join(dirPath, fname), t, isFasta, reSort=reSort)
+                for fname in tqdm(fnames)
             ]
         else:
-            return Parallel(n_jobs=threads, verbose=11)(
+            return Parallel(n_jobs=threads, backend="threading", verbose=11)(
                 delayed(Batch.from_file)(
                     os.path.join(dirPath, fname), t, isFasta, reSort=reSort
                 )
-                for fname in os.listdir(dirPath)
+                for fname in fnames
             )
 
 
@@ -300,68 +325,100 @@ class FastaBatcher(BatcherThreading):
 
     @doReverseComplement.setter
     def doReverseComplement(self, rc):
-        assert type(True) == type(rc)
+        assert isinstance(rc, bool)
         self._doReverseComplement = rc
 
     def __do_over_kmers(self, FH, k, feedMode=BatcherThreading.FEED_MODE.APPEND):
         """Parallelize over kmers.
 
-        Use RecordBatcher to parallelize when batching the kmers.
+        Use RecordBatcher to parallelize when batching the kmers. K-mers of
+        consecutive records are streamed into the same collection, and batches
+        are written (sorted) only once they are full.
 
         Arguments:
-                FH {io.TextIOWrapper} -- fasta file buffer
+                FH {io.BufferedReader} -- fasta file buffer
                 k {int} -- k-mer length
                 feedMode {BatcherThreading.FEED_MODE}
         """
         batcher = FastaRecordBatcher.from_parent(self)
         for record in SmartFastaParser(FH).parse():
-            batcher.do(record, k)
-            for batch in batcher.collection:
-                batch.unwrite()
+            batcher.do(record, k, doWrite=False)
         self.feed_collection(batcher.collection, feedMode)
         self.write_all(doSort=True, verbose=True)
 
+    def __record_jobs(self, FH, k):
+        """Group FASTA records into jobs of comparable size.
+
+        Short records are bundled together until a job holds at least
+        self.size bases, while records longer than 4*self.size are split into
+        overlapping chunks (see Sequence.batcher), one per job.
+
+        Arguments:
+                FH {io.BufferedReader} -- fasta file buffer
+                k {int} -- k-mer length
+
+        Yields:
+                list -- list of (header, sequence, offset) tuples
+        """
+        size = int(self.size)
+        job, job_size = [], 0
+        for header, seq in SmartFastaParser(FH).parse():
+            if len(seq) > 4 * size:
+                for chunk, offset in Sequence.batcher(seq, k, size):
+                    yield [(header, chunk, offset)]
+                continue
+            job.append((header, seq, 0))
+            job_size += len(seq)
+            if job_size >= size:
+                yield job
+                job, job_size = [], 0
+        if 0 != len(job):
+            yield job
+
     def __do_over_records(self, FH, k, feedMode=BatcherThreading.FEED_MODE.APPEND):
         """Parallelize over FASTA records.
 
-        Ran a non-parallelized RecordBatcher for each fasta record, in parallel.
+        Ran a non-parallelized RecordBatcher for each job of fasta records, in
+        parallel. See __record_jobs for how records are grouped into jobs.
 
         Arguments:
-                FH {io.TextIOWrapper} -- fasta file buffer
+                FH {io.BufferedReader} -- fasta file buffer
                 k {int} -- k-mer length
                 feedMode {BatcherThreading.FEED_MODE}
         """
 
-        def do_record(size, natype, tmp, record, k):
-            """Batch a single record.
+        def do_job(size, natype, tmp, rc, job, k):
+            """Batch a group of records.
 
             Function to be passed to Parallel(delayed(*)).
 
             Arguments:
-                    fastaBatcher {FastaBatcher} -- batcher
-                    record {tuple} -- (header, sequence)
+                    size {int} -- batch size
+                    natype {om.NATYPES} -- nucleic acid type
+                    tmp {str} -- path to temporary directory
+                    rc {bool} -- whether to batch also the reverse complement
+                    job {list} -- list of (header, sequence, offset) tuples
                     k {int} -- k-mer length
 
             Returns:
                     list -- list of Batches
             """
             batcher = FastaRecordBatcher(1, size, natype, tmp)
-            batcher.do(record, k, False)
+            batcher.doReverseComplement = rc
+            for header, seq, offset in job:
+                batcher.do((header, seq), k, False, offset, doWrite=False)
+            batcher.write_all(doSort=True)
             return batcher.collection
 
         batchCollections = Parallel(n_jobs=self.threads, verbose=11)(
-            delayed(do_record)(self.size, self.natype, self.tmp, record, k)
-            for record in SmartFastaParser(FH).parse()
+            delayed(do_job)(
+                self.size, self.natype, self.tmp, self.doReverseComplement, job, k
+            )
+            for job in self.__record_jobs(FH, k)
         )
 
         self.feed_collection(list(itertools.chain(*batchCollections)), feedMode)
-
-        def do_sort_write(b):
-            b.write(True)
-
-        Parallel(n_jobs=self.threads, verbose=11)(
-            delayed(do_sort_write)(b) for b in self.collection if 0 != b.current_size
-        )
+        self.write_all(doSort=True, verbose=True)
 
     def do(self, fasta, k, feedMode=BatcherThreading.FEED_MODE.APPEND):
         """Start batching the fasta file.
@@ -376,11 +433,7 @@ class FastaBatcher(BatcherThreading):
         assert os.path.isfile(fasta)
         assert k > 1
 
-        if fasta.endswith(".gz"):
-            FH = gzip.open(fasta, "rt")
-        else:
-            FH = open(fasta, "r+")
-
+        FH = open_fasta(fasta)
         if self._mode == self.MODE.KMERS:
             self.__do_over_kmers(FH, k, feedMode)
         elif self._mode == self.MODE.RECORDS:
@@ -422,10 +475,10 @@ class FastaRecordBatcher(BatcherThreading):
 
     @doReverseComplement.setter
     def doReverseComplement(self, rc):
-        assert type(True) == type(rc)
+        assert isinstance(rc, bool)
         self._doReverseComplement = rc
 
-    def do(self, record, k, verbose=True):
+    def do(self, record, k, verbose=True, offset=0, doWrite=True):
         """Start batching a fasta record.
 
         Requires a fasta record with header and sequence.
@@ -433,25 +486,44 @@ class FastaRecordBatcher(BatcherThreading):
         Arguments:
                 record {tuple} -- (header, sequence)
                 k {int} -- length of k-mers
+
+        Keyword Arguments:
+                verbose {bool} -- whether to log progress (default: {True})
+                offset {number} -- if the sequence is a chunk of the record,
+                                   its location in the record (default: {0})
+                doWrite {bool} -- whether to write the batches at the end
+                                  (default: {True})
         """
         record_name = record[0].split(" ")[0]
         if verbose:
             logging.info(f"Batching record '{record_name}'...")
         if 1 == self.threads:
             kmerGen = Sequence.kmerator(
-                record[1], k, self.natype, record_name, rc=self.doReverseComplement
+                record[1],
+                k,
+                self.natype,
+                record_name,
+                offset,
+                rc=self.doReverseComplement,
             )
-            kmerGen = tqdm(kmerGen) if verbose else kmerGen
-            for kmer in kmerGen:
-                if kmer.is_ab_checked():
-                    self.add_record(kmer)
+            with tqdm(disable=not verbose, mininterval=0.5) as pbar:
+                kmer_count = 0
+                for kmer_count, kmer in enumerate(kmerGen, 1):
+                    if kmer.is_ab_checked():
+                        self.add_record(kmer)
+                    if 0 == kmer_count % PROGRESS_STEP:
+                        pbar.update(PROGRESS_STEP)
+                pbar.update(kmer_count % PROGRESS_STEP)
         else:
             batches = Parallel(n_jobs=self.threads, verbose=11)(
-                delayed(FastaRecordBatcher.build_batch)(seq, record_name, k, self, i)
-                for (seq, i) in Sequence.batcher(record[1], k, self.size)
+                delayed(FastaRecordBatcher.build_batch)(
+                    seq, record_name, k, self, i + offset
+                )
+                for (seq, i) in Sequence.batcher(record[1], k, int(self.size))
             )
             self.feed_collection(batches, self.FEED_MODE.APPEND)
-        self.write_all()
+        if doWrite:
+            self.write_all(doSort=True)
 
     @staticmethod
     def build_batch(seq, name, k, batcher, i=0):
@@ -2,3 +2,36 @@
 @author: Gabriele Girelli
 @contact: gigi.ga90@gmail.com
 """
+
+# Number of items processed between two progress bar updates in hot loops
+PROGRESS_STEP = 1 << 16
+
+# Read buffer size (in bytes) for Fasta input
+FASTA_BUFFER_SIZE = 1 << 20
+
+# Write buffer size (in bytes) for joined output
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Size (in bytes) of the blocks used when copying batch files
+COPY_BUFFER_SIZE = 1 << 18
+
+# Maximum total size (in bytes) of the batch files joined in memory with numpy
+NUMPY_JOIN_MAX_BYTES = 1 << 26
+
+# Number of record groups passed at once from the crawling to the joining thread
+JOIN_CHUNK_SIZE = 1 << 12
+
+# Size (in bytes) of the binary blocks read at once by SmartFastaParser
+FASTA_BLOCK_SIZE = 1 << 18
+
+# Maximum number of Fasta buffers kept open at the same time by SmartFastaParser
+MAX_OPEN_FASTA = 256
+
+# Default gzip compression level of the AbundanceVector output files
+VECTOR_COMPRESS_LEVEL = 9
+
+# Counts below this value are written through a table of preformatted labels
+COUNT_LABELS = 1 << 12
+
+# Number of counts buffered in memory by AbundanceVectorLocal before writing them
+VECTOR_FLUSH_SIZE = 1 << 20
@@ -4,76 +4,255 @@
 @description: methods for sequence manipulation
 """
 
-import gzip
+from collections import OrderedDict
+from contextlib import contextmanager
 import io
-from typing import List, Tuple
+from kman.const import FASTA_BLOCK_SIZE, FASTA_BUFFER_SIZE, MAX_OPEN_FASTA
+import shutil
+import subprocess
+import threading
+from typing import IO, Iterator, Tuple
+
+# Module used for gzip I/O: isal (faster) when installed, gzip otherwise, and
+# the compression levels it accepts
+try:
+    from isal import igzip as gzip_module  # type: ignore
+
+    GZIP_MODULE_LEVELS = range(0, 4)
+except ImportError:
+    import gzip as gzip_module  # type: ignore
+
+    GZIP_MODULE_LEVELS = range(1, 10)
+
+# Compression levels accepted by gzip_writer, as by gzip and pigz
+GZIP_LEVELS = range(1, 10)
+
+
+def open_fasta(path: str) -> IO[bytes]:
+    """Open a Fasta file for binary reading, with a large read buffer.
+
+    Gzipped files (ending in ".gz") are decompressed on the fly, reading
+    FASTA_BUFFER_SIZE bytes of decompressed data at a time instead of the
+    default 8KB.
+
+    Arguments:
+            path {str} -- path to Fasta file
+
+    Returns:
+            IO[bytes] -- binary buffer
+    """
+    if path.endswith(".gz"):
+        return io.BufferedReader(
+            gzip_module.open(path, "rb"), buffer_size=FASTA_BUFFER_SIZE
+        )
+    return open(path, "rb", buffering=FASTA_BUFFER_SIZE)
+
+
+def count_fasta_records(path: str) -> int:
+    """Count the records of a Fasta file, from its header lines only.
+
+    The file is read in binary blocks of FASTA_BLOCK_SIZE bytes, counting the
+    '>' at the start of a line, without parsing or decoding the sequences.
+
+    Arguments:
+            path {str} -- path to Fasta file
+
+    Returns:
+            int -- number of records
+    """
+    count = 0
+    last = b"\n"
+    with open_fasta(path) as FH:
+        for block in iter(lambda: FH.read(FASTA_BLOCK_SIZE), b""):
+            count += block.count(b"\n>")
+            if b"\n" == last and block.startswith(b">"):
+                count += 1
+            last = block[-1:]
+    return count
+
+
+def gzip_module_level(compresslevel: int) -> int:
+    """Convert a gzip compression level to one accepted by gzip_module.
+
+    The GZIP_LEVELS are spread evenly over the GZIP_MODULE_LEVELS, as isal
+    has fewer compression levels than gzip.
+
+    Arguments:
+            compresslevel {int} -- compression level, in GZIP_LEVELS
+
+    Returns:
+            int -- compression level, in GZIP_MODULE_LEVELS
+    """
+    assert compresslevel in GZIP_LEVELS, "compression level must be in [1, 9]."
+    index = GZIP_LEVELS.index(compresslevel) * len(GZIP_MODULE_LEVELS)
+    return GZIP_MODULE_LEVELS[index // len(GZIP_LEVELS)]
+
+
+@contextmanager
+def gzip_writer(path: str, compresslevel: int) -> Iterator[IO[bytes]]:
+    """Open a gzipped file for binary writing.
+
+    Compression is delegated to a pigz (parallel gzip) subprocess when pigz is
+    available on the PATH, and performed in-process otherwise (converting
+    the compression level with gzip_module_level).
+
+    Arguments:
+            path {str} -- path to output file
+            compresslevel {int} -- compression level, in GZIP_LEVELS
+
+    Yields:
+            IO[bytes] -- binary buffer
+    """
+    assert compresslevel in GZIP_LEVELS, "compression level must be in [1, 9]."
+    pigz = shutil.which("pigz")
+    if pigz is None:
+        level = gzip_module_level(compresslevel)
+        with gzip_module.open(path, "wb", compresslevel=level) as OH:
+            yield OH
+        return
+
+    with open(path, "wb") as GH:
+        proc = subprocess.Popen(
+            [pigz, f"-{compresslevel}", "-c"], stdin=subprocess.PIPE, stdout=GH
+        )
+        try:
+            yield proc.stdin
+        finally:
+            proc.stdin.close()
+            proc.wait()
+    assert 0 == proc.returncode, f"pigz failed with exit code {proc.returncode}."
 
 
 class SmartFastaParser(object):
     """Fasta parser with minimally open buffer.
 
     Extends the SimpleFastaParser function to avoid 'too many open files' issue.
-    The input buffer is opened only when needed, and the byte-based position in
-    the Fasta file is kept in memory. This continuous opening/closing adds a bit
-    of an overhead but is useful when many Fasta files must be parsed at the
-    same time.
+    Open buffers are shared across parsers in a least-recently-used cache of at
+    most MAX_OPEN_FASTA buffers. When a parser buffer is evicted, it is closed
+    and the byte-based position in the Fasta file is kept in memory, so that
+    the buffer can be re-opened when needed. This is useful when many Fasta
+    files must be parsed at the same time, while parsing a single file (or a
+    few) stays a single streaming pass. As seeking a re-opened gzipped buffer
+    means decompressing it again up to the recorded position, buffers of
+    uncompressed files are evicted first. The cache is guarded by a lock, as
+    parsers are used concurrently by the threading batchers.
+
+    The Fasta is read in binary blocks of FASTA_BLOCK_SIZE bytes, and records
+    are split at the '\\n>' boundaries, to skip line-by-line text decoding.
 
     Variables:
             __compressed {bool} -- whether the Fasta is compressed.
-            __pos {number} -- byte-based location in the Fasta file.
+            __pos {number} -- byte-based location in the Fasta file, tracked
+                              from the size of the blocks read.
+            __open_parsers {OrderedDict} -- parsers with an open buffer, from
+                                            least to most recently used.
+            __lock {threading.RLock} -- guards __open_parsers, and the buffers
+                                        while they are read or closed.
     """
 
     __compressed = False
     __pos = 0
+    __open_parsers: "OrderedDict[SmartFastaParser, None]" = OrderedDict()
+    __lock = threading.RLock()
 
     def __init__(self, FH):
         super(SmartFastaParser, self).__init__()
-        if str == type(FH):
-            if FH.endswith(".gz"):
-                self.__compressed = True
-                self.__FH = gzip.open(FH, "rt")
-            else:
-                self.__FH = open(FH, "r+")
-        elif io.TextIOWrapper == type(FH):
+        if isinstance(FH, str):
+            self.__FH = open_fasta(FH)
+        elif isinstance(FH, io.TextIOWrapper):
+            self.__FH = FH.buffer
+        elif isinstance(FH, io.BufferedIOBase):
             self.__FH = FH
-            if self.__FH.name.endswith(".gz"):
-                self.__compressed = True
         else:
             assert False, "type error."
+        self.__compressed = self.__FH.name.endswith(".gz")
+        self.__pos = self.__FH.tell()
 
-    def __reopen(self):
-        """Re-open the buffer and seek the last recorded position."""
+    def __reopen(self) -> None:
+        """Make sure the buffer is open, re-opening it if it was evicted."""
+        if self in self.__open_parsers:
+            self.__open_parsers.move_to_end(self)
+            return
         if self.__FH.closed:
-            if self.__compressed:
-                self.__FH = gzip.open(self.__FH.name, "rt")
-            else:
-                self.__FH = open(self.__FH.name, "r+")
-        self.__FH.seek(self.__pos)
+            self.__FH = open_fasta(self.__FH.name)
+            self.__FH.seek(self.__pos)
+        self.__open_parsers[self] = None
+        if len(self.__open_parsers) > MAX_OPEN_FASTA:
+            self.__evict()
 
-    def __skip_blank_and_comments(self) -> Tuple[str, bool]:
+    def __evict(self) -> None:
+        """Close the least recently used buffer of an uncompressed Fasta.
+
+        Falls back to the least recently used buffer if all others are
+        compressed. The buffer of the current parser is never evicted.
+        """
+        for parser in self.__open_parsers:
+            if parser is not self and not parser.__compressed:
+                break
+        else:
+            parser = next(iter(self.__open_parsers))
+        parser.__close()
+
+    def __close(self) -> None:
+        """Close the buffer and drop it from the open buffers cache."""
+        with self.__lock:
+            self.__open_parsers.pop(self, None)
+            self.__FH.close()
+
+    def __read_block(self) -> bytes:
+        """Read the next binary block, re-opening the buffer if needed.
+
+        The buffer is read while holding the lock, so that it cannot be
+        evicted by another thread in the meantime.
+
+        Returns:
+                bytes -- empty at the end of the file.
+        """
+        with self.__lock:
+            self.__reopen()
+            block = self.__FH.read(FASTA_BLOCK_SIZE)
+        self.__pos += len(block)
+        return block
+
+    def __skip_blank_and_comments(self) -> Tuple[bytes, int]:
         # Skip any text before the first record (e.g. blank lines, comments)
+        last = b"\n"
         while True:
-            line = self.__FH.readline()
-            self.__pos = self.__FH.tell()
-            if line == "":
-                return ("", False)  # Premature end of file, or just empty?
-            if line[0] == ">":
-                break
-        return (line, True)
+            block = self.__read_block()
+            if block == b"":
+                return (b"", -1)  # Premature end of file, or just empty?
+            start = (last + block).find(b"\n>")
+            if -1 != start:
+                return (block, start)
+            last = block[-1:]
+
+    def __records(self) -> Iterator[bytes]:
+        """Split the binary stream into raw records.
+
+        Yields:
+                bytes -- record, starting with '>'
+        """
+        block, start = self.__skip_blank_and_comments()
+        assert -1 != start, "premature end of file or empty file"
 
-    def __parse_sequence(self) -> List[str]:
-        lines = []
-        line = self.__FH.readline()
+        pieces = []
         while True:
-            if not line:
-                break
-            if line[0] == ">":
-                break
-            else:
-                self.__pos = self.__FH.tell()
-            lines.append(line.rstrip())
-            line = self.__FH.readline()
-        return lines
+            end = block.find(b"\n>", start)
+            if -1 != end:
+                pieces.append(block[start : end + 1])
+                yield b"".join(pieces)
+                pieces = []
+                start = end + 1
+                continue
+
+            pieces.append(block[start:])
+            block, start = self.__read_block(), 0
+            if block == b"":
+                yield b"".join(pieces)
+                return
+            if block.startswith(b">") and pieces[-1].endswith(b"\n"):
+                yield b"".join(pieces)
+                pieces = []
 
     def parse(self):
         """Iterate over Fasta records as string tuples.
@@ -84,32 +263,15 @@ class SmartFastaParser(object):
         identifier (the first word) and comment or description.
 
         Additionally, keep the Fasta handler open only when strictly necessary.
+        The buffer is closed also when the generator is abandoned early.
         """
-        self.__reopen()
-        line, parsable = self.__skip_blank_and_comments()
-        assert parsable, "premature end of file or empty file"
-
-        while True:
-            self.__reopen()
-            if line is None:
-                line = self.__FH.readline()
-
-            if not line:
-                return
-
-            if line[0] != ">":
-                raise ValueError(
-                    "Records in Fasta files should start with '>' character"
-                )
-            title = line[1:].rstrip()
-            seq_lines = self.__parse_sequence()
-
-            self.__FH.close()
-            yield title, "".join(seq_lines).replace(" ", "").replace("\r", "")
-
-            line = None
-
-        assert False, "Should not reach this line"
+        try:
+            for record in self.__records():
+                title, _, seq = record.partition(b"\n")
+                seq = seq.translate(None, b" \t\r\n")
+                yield title[1:].decode().rstrip(), seq.decode()
+        finally:
+            self.__close()
 
     @staticmethod
     def parse_file(path):
@@ -4,18 +4,41 @@
 @description: methods for batch joining
 """
 
+from bisect import bisect_right
+from collections import Counter, defaultdict
 from enum import Enum
 from heapq import merge
-from itertools import chain
+from itertools import chain, groupby, islice, product
 from joblib import Parallel, delayed  # type: ignore
 from kman.abundance import AbundanceVector, AbundanceVectorLocal
+from kman.abundance import AbundanceVectorStream
 from kman.batch import Batch, BatchAppendable
 from kman.batcher import BatcherThreading
+from kman.const import (
+    COPY_BUFFER_SIZE,
+    JOIN_CHUNK_SIZE,
+    NUMPY_JOIN_MAX_BYTES,
+    OUTPUT_BUFFER_SIZE,
+    PROGRESS_STEP,
+    VECTOR_COMPRESS_LEVEL,
+)
+from kman.io import GZIP_LEVELS
 from kman.seq import SequenceCoords, SequenceCount
+import logging
 import multiprocessing as mp
 import numpy as np  # type: ignore
+from operator import itemgetter
+import os
+from queue import Full, Queue
+import shutil
 import tempfile
+import threading
 from tqdm import tqdm  # type: ignore
+from typing import List
+
+# 2-bit codes of the nucleotides, by byte value, 255 for any other byte
+BASE_CODES = np.full(256, 255, dtype=np.uint8)
+BASE_CODES[[ord(base) for base in "ACGT"]] = np.arange(4)
 
 
 class Crawler(object):
@@ -46,14 +69,34 @@ class Crawler(object):
         Returns:
                 int -- number of records
         """
-        return sum([b.current_size for b in batches])
+        return sum(b.current_size for b in batches)
+
+    def count_bytes(self, batches):
+        """Measure the size of the batch files, before joining them in memory.
+
+        Records of batches that are not written are already in memory, and
+        are not counted. The size of gzipped batches is unknown until they are
+        decompressed, hence it is reported as infinite.
+
+        Arguments:
+                batches {list} -- list of Batches
+
+        Returns:
+                float -- number of bytes
+        """
+        written = [b.tmp for b in batches if b.is_written]
+        if any(path.endswith(".gz") for path in written):
+            return float("inf")
+        return sum(os.path.getsize(path) for path in written)
 
     def do_records(self, batches):
         """Crawl through the batches.
 
-        Produces a generator function that yields (r.header, r.seq) for each
-        record r across batches. Batches are crawled through their r.record_gen
-        if self.doSort==False, otherwise using r.sorted.
+        Produces a generator function that yields (r.seq, r.header) for each
+        record r across batches. Batches are crawled through their r.tuple_gen,
+        which are sorted if self.doSort==True. Records are yielded sequence
+        first, so that they are merged by plain tuple comparison, without a key
+        function.
 
         Arguments:
                 batches {list} -- list of Batches
@@ -61,29 +104,26 @@ class Crawler(object):
         Returns:
                 generator -- record generator
         """
-        assert all([type(b) in [Batch, BatchAppendable] for b in batches])
+        assert all(isinstance(b, (Batch, BatchAppendable)) for b in batches)
 
         if self.doSort:
             generators = [
-                ((r.header, r.seq) for r in b.sorted(self.doSmart))
-                for b in batches
-                if not type(None) == type(b)
+                sorted(b.tuple_gen(self.doSmart)) for b in batches if b is not None
             ]
         else:
-            generators = [
-                ((r.header, r.seq) for r in b.record_gen(self.doSmart))
-                for b in batches
-                if not type(None) == type(b)
-            ]
+            generators = [b.tuple_gen(self.doSmart) for b in batches if b is not None]
 
-        crawler = merge(*generators, key=lambda x: x[1])
+        crawler = merge(*generators)
 
         return crawler
 
     def do_batch(self, batches):
         """Group records from batches based on sequence.
 
-        Crawls into groups of records from input batches.
+        Crawls into groups of records from input batches. Consecutive merged
+        records are grouped by itertools.groupby, which runs the comparison
+        loop in C. When verbose, the progress bar is updated every
+        PROGRESS_STEP records, instead of once per record.
 
         Arguments:
                 batches {list} -- list of Batches
@@ -91,26 +131,178 @@ class Crawler(object):
         Yields:
                 tuple -- (headers, sequence)
         """
-        crawler = self.do_records(batches)
+        groups = groupby(self.do_records(batches), key=itemgetter(0))
+
+        if not self.verbose:
+            for seq, records in groups:
+                yield ([record[1] for record in records], seq)
+            return
+
+        with tqdm(desc=self.desc, total=self.count_records(batches)) as pbar:
+            counted = 0
+            for seq, records in groups:
+                headers = [record[1] for record in records]
+                counted += len(headers)
+                if counted >= PROGRESS_STEP:
+                    pbar.update(counted)
+                    counted = 0
+                yield (headers, seq)
+            pbar.update(counted)
+
+    def do_batch_in_memory(self, batches):
+        """Group records from batches based on sequence, in memory.
+
+        Loads all the records at once, and sorts them by sequence with numpy,
+        comparing fixed-width byte strings in C instead of merging them one by
+        one. Group boundaries are then found where consecutive sequences
+        differ. Sequences are compared as 64-bit integers whenever possible
+        (see Crawler.encode_seqs). Batches do not need to be sorted. Only
+        suitable for small batch files (see NUMPY_JOIN_MAX_BYTES).
 
-        first_record = next(crawler)
-        current_seq = first_record[1]
-        current_headers = [first_record[0]]
+        Arguments:
+                batches {list} -- list of Batches
 
-        if self.verbose:
-            crawler = tqdm(
-                crawler, initial=1, desc=self.desc, total=self.count_records(batches)
-            )
+        Yields:
+                tuple -- (headers, sequence)
+        """
+        seqs, headers = [], []
+        for batch in batches:
+            for seq, header in batch.tuple_gen(self.doSmart):
+                seqs.append(seq)
+                headers.append(header)
+        if 0 == len(seqs):
+            return
+        seqs = np.array(seqs, dtype=bytes)
+
+        keys = self.encode_seqs(seqs)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        seqs = seqs[order]
+        headers = [headers[i] for i in order.tolist()]
+        boundaries = np.flatnonzero(
+            np.concatenate(([True], keys[1:] != keys[:-1], [True]))
+        ).tolist()
+
+        for start, end in zip(boundaries[:-1], boundaries[1:]):
+            yield (headers[start:end], seqs[start].decode())
 
-        for record in crawler:
-            if current_seq == record[1]:
-                current_headers.append(record[0])
-            else:
-                yield (current_headers, current_seq)
-                current_seq = record[1]
-                current_headers = [record[0]]
+    @staticmethod
+    def encode_seqs(seqs):
+        """Encode sequences as sortable integers.
+
+        Sequences of the same length, of at most 32 nucleotides, and only made
+        of A, C, G, and T, are packed into 64-bit integers (2 bits per base).
+        The packed integers sort as the sequences do, but are compared with a
+        single integer comparison.
+
+        Arguments:
+                seqs {np.ndarray} -- fixed-width byte string array of sequences
+
+        Returns:
+                np.ndarray -- packed sequences, or seqs if they cannot be packed
+        """
+        width = seqs.dtype.itemsize
+        if 0 == width or 32 < width:
+            return seqs
+        codes = BASE_CODES[seqs.view(np.uint8)]
+        if (codes == 255).any():
+            return seqs
+
+        codes = codes.reshape(seqs.shape[0], width)
+        keys = np.zeros(seqs.shape[0], dtype=np.uint64)
+        for i in range(width):
+            keys <<= np.uint64(2)
+            keys |= codes[:, i]
+        return keys
+
+    def do_batch_prefetched(self, batches, maxsize=4):
+        """Group records from batches based on sequence, in a reader thread.
+
+        The groups produced by do_batch are passed from a reader thread in
+        chunks of JOIN_CHUNK_SIZE, through a bounded queue. This way, merging
+        the batches (mostly I/O) overlaps with processing the groups.
+        When the generator is closed before the end, the reader thread is
+        stopped and joined, closing the batches it was reading.
+
+        Arguments:
+                batches {list} -- list of Batches
+
+        Keyword Arguments:
+                maxsize {number} -- maximum number of chunks waiting in the
+                                    queue (default: {4})
+
+        Yields:
+                tuple -- (headers, sequence)
+        """
+        queue: Queue = Queue(maxsize)
+        stop = threading.Event()
+        reader = threading.Thread(
+            target=self.__prefetch, args=(batches, queue, stop), daemon=True
+        )
+        reader.start()
+        try:
+            yield from self.__consume_prefetched(queue)
+        finally:
+            stop.set()
+            reader.join()
+
+    def __prefetch(self, batches, queue, stop):
+        """Queue the groups from batches in chunks, until stop is set.
+
+        Run by the reader thread of do_batch_prefetched. The end of the groups
+        is marked by a None, and exceptions are queued to be raised by the
+        consumer. The batches are closed on exit.
+
+        Arguments:
+                batches {list} -- list of Batches
+                queue {Queue} -- queue to the consumer
+                stop {threading.Event} -- set when the consumer stopped
+        """
+        groups = self.do_batch(batches)
+        try:
+            for chunk in iter(lambda: list(islice(groups, JOIN_CHUNK_SIZE)), []):
+                if not self.__put_unless_stopped(queue, stop, chunk):
+                    return
+            self.__put_unless_stopped(queue, stop, None)
+        except BaseException as e:
+            self.__put_unless_stopped(queue, stop, e)
+        finally:
+            groups.close()
+
+    @staticmethod
+    def __put_unless_stopped(queue, stop, item):
+        """Put an item in the queue, unless the consumer stopped.
 
-        yield (current_headers, current_seq)
+        Arguments:
+                queue {Queue} -- queue to the consumer
+                stop {threading.Event} -- set when the consumer stopped
+                item -- item to queue
+
+        Returns:
+                bool -- whether the item was queued
+        """
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    @staticmethod
+    def __consume_prefetched(queue):
+        """Yield the groups queued by Crawler.__prefetch.
+
+        Arguments:
+                queue {Queue} -- queue from the reader thread
+
+        Yields:
+                tuple -- (headers, sequence)
+        """
+        for chunk in iter(queue.get, None):
+            if isinstance(chunk, BaseException):
+                raise chunk
+            yield from chunk
 
 
 class KJoiner(object):
@@ -123,6 +315,8 @@ class KJoiner(object):
             DEFAULT_MODE {MODE} -- default join mode
             __mode {MODE} -- join mode
             __join_function {function} -- join method
+            __compressLevel {int} -- gzip compression level of AbundanceVector
+                                     output files
     """
 
     class MODE(Enum):
@@ -164,6 +358,7 @@ class KJoiner(object):
     __mode = DEFAULT_MODE
     __memory = DEFAULT_MEMORY
     __join_function = None
+    __compressLevel = VECTOR_COMPRESS_LEVEL
 
     def __init__(self, mode=None, memory=None):
         """Initialize KJoiner.
@@ -200,6 +395,16 @@ class KJoiner(object):
         self.__memory = memory
         self.__set_join_function()
 
+    @property
+    def compressLevel(self):
+        return self.__compressLevel
+
+    @compressLevel.setter
+    def compressLevel(self, compressLevel):
+        assert isinstance(compressLevel, int)
+        assert compressLevel in GZIP_LEVELS, "compression level must be in [1, 9]."
+        self.__compressLevel = compressLevel
+
     @property
     def join_function(self):
         return self.__join_function
@@ -227,9 +432,7 @@ class KJoiner(object):
                 seq {str} -- sequence
         """
         if len(headers) == 1:
-            batch = (headers[0], seq)
-            OH.write(">%s\n%s\n" % batch)
-            return batch
+            OH.write(f">{headers[0]}\n{seq}\n")
 
     @staticmethod
     def join_sequence_count(headers, seq, OH, **kwargs):
@@ -242,9 +445,7 @@ class KJoiner(object):
                 headers {list} -- list of headers with seq
                 seq {str} -- sequence
         """
-        batch = (seq, len(headers))
-        OH.write("%s\t%d\n" % batch)
-        return batch
+        OH.write(f"{seq}\t{len(headers)}\n")
 
     @staticmethod
     def join_vector_count(headers, seq, OH, vector, **kwargs):
@@ -257,11 +458,14 @@ class KJoiner(object):
                 vector {AbundanceVector}
         """
         hcount = len(headers)
+        k = len(seq)
+        split_str = SequenceCoords.split_str
+        positions = defaultdict(list)
         for header in headers:
-            coords = SequenceCoords.from_str(header)
-            vector.add_count(
-                coords.ref, coords.strand.label, int(coords.start), hcount, len(seq)
-            )
+            ref, start, _, strand = split_str(header)
+            positions[(ref, strand.label)].append(start)
+        for (ref, strand), starts in positions.items():
+            vector.add_counts(ref, strand, starts, hcount, k)
 
     @staticmethod
     def join_vector_count_masked(headers, seq, OH, vector, **kwargs):
@@ -273,22 +477,24 @@ class KJoiner(object):
                 seq {str} -- sequence
                 vector {AbundanceVector}
         """
-        headers = [SequenceCoords.from_str(h) for h in headers]
         if not 1 == len(headers):
-            refList, refCounts = np.unique([h.ref for h in headers], return_counts=True)
+            headers = [SequenceCoords.split_str(h) for h in headers]
+            refCounts = Counter(h[0] for h in headers)
 
-            if not 1 == len(refList):
-                for h in headers:
-                    hcount = refCounts[refList != h.ref].sum()
-                    vector.add_count(
-                        h.ref, h.strand.label, int(h.start), hcount, len(seq)
-                    )
+            if not 1 == len(refCounts):
+                hcount = len(headers)
+                k = len(seq)
+                add_count = vector.add_count
+                for ref, start, _, strand in headers:
+                    add_count(ref, strand.label, start, hcount - refCounts[ref], k)
 
     def _pre_join(self, outpath):
         """Prepares for joining.
 
         Perform appropriate actiond (mode-based):
-        - open buffer to output file
+        - open buffer to output file, flushed every OUTPUT_BUFFER_SIZE bytes
+          and UTF-8 encoded (for the built-in encoder to be used whatever the
+          locale)
         - create AbundanceVector instance
 
         Arguments:
@@ -299,12 +505,14 @@ class KJoiner(object):
         """
         kwargs = {"OH": outpath}
         if not self.mode.name.startswith("VEC_"):
-            kwargs["OH"] = open(outpath, "w+")
+            kwargs["OH"] = open(
+                outpath, "w", buffering=OUTPUT_BUFFER_SIZE, encoding="utf-8"
+            )
         else:
             if self.memory == self.MEMORY.NORMAL:
-                kwargs["vector"] = AbundanceVector()
+                kwargs["vector"] = AbundanceVector(self.compressLevel)
             elif self.memory == self.MEMORY.LOCAL:
-                kwargs["vector"] = AbundanceVectorLocal()
+                kwargs["vector"] = AbundanceVectorLocal(self.compressLevel)
             else:
                 assert self.memory in [self.MEMORY.NORMAL, self.MEMORY.LOCAL]
         return kwargs
@@ -327,7 +535,11 @@ class KJoiner(object):
     def join(self, batches, outpath, doSort=False):
         """Join batches.
 
-        Perform k-joining of batches.
+        Perform k-joining of batches. Batch files up to NUMPY_JOIN_MAX_BYTES
+        in total (see Crawler.count_bytes) are joined in memory (see
+        Crawler.do_batch_in_memory), otherwise batches are merged in a reader
+        thread, while joining the merged groups (see
+        Crawler.do_batch_prefetched).
 
         Arguments:
                 batches {list} -- list of Batch instances
@@ -340,9 +552,15 @@ class KJoiner(object):
         kwargs = self._pre_join(outpath)
 
         crawler = Crawler()
-        print("Joining...")
-        for batch in crawler.do_batch(batches):
-            self.join_function(*batch, **kwargs)
+        crawler.doSort = doSort
+        logging.info("Joining...")
+        if crawler.count_bytes(batches) <= NUMPY_JOIN_MAX_BYTES:
+            groups = crawler.do_batch_in_memory(batches)
+        else:
+            groups = crawler.do_batch_prefetched(batches)
+        join_function = self.join_function
+        for batch in groups:
+            join_function(*batch, **kwargs)
 
         self._post_join(**kwargs)
 
@@ -376,7 +594,7 @@ class KJoinerThreading(KJoiner):
 
     @doSort.setter
     def doSort(self, doSort):
-        assert type(True) == type(doSort)
+        assert isinstance(doSort, bool)
         self.__doSort = doSort
 
     @property
@@ -393,7 +611,7 @@ class KJoinerThreading(KJoiner):
 
     @batch_size.setter
     def batch_size(self, batch_size):
-        assert type(0) == type(batch_size)
+        assert isinstance(batch_size, int)
         assert batch_size >= 2
         self.__batch_size = batch_size
 
@@ -406,21 +624,89 @@ class KJoinerThreading(KJoiner):
     def __parallel_join(self, recordBatches, outpath):
         """Joins sequenceCount batches in paralle.
 
+        Intermediate batches are partitioned by sequence range, one partition
+        per thread. Partitions are joined in parallel, each into its own
+        output file, and then concatenated. In VEC_ modes, the counts of each
+        partition are streamed to a file (see AbundanceVectorStream), and
+        merged into a single AbundanceVector, instead of building a dense
+        vector per partition. When storing the AbundanceVector locally, the
+        partitions are joined sequentially instead.
+
         Arguments:
                 recordBatches {list} -- list of Batches
                 outpath {str} -- path to output
         """
-        kwargs = self._pre_join(outpath)
-
         batcher = SeqCountBatcher.from_parent(self, self.batch_size)
         batcher.doSort = self.doSort
-        print("Intermediate batching...")
+        batcher.n_parts = self.threads
+        logging.info("Intermediate batching...")
         batcher.do(recordBatches)
-        print("Joining...")
-        batcher.join(self.join_function, **kwargs)
+        logging.info("Joining...")
+
+        if self.memory == self.MEMORY.LOCAL:
+            kwargs = self._pre_join(outpath)
+            batcher.join(self.join_function, **kwargs)
+            self._post_join(**kwargs)
+            return
+
+        # Only the partitions that were batched (none, with no input) are joined
+        partPaths = [
+            os.path.join(self.tmp.name, f"part{i}.txt")
+            for i in range(len(batcher.parts))
+        ]
+        Parallel(n_jobs=self.threads, verbose=11)(
+            delayed(KJoinerThreading.join_part)(self.mode, batches, partPath)
+            for batches, partPath in zip(batcher.parts, partPaths)
+        )
 
+        kwargs = self._pre_join(outpath)
+        for partPath in partPaths:
+            if self.mode.name.startswith("VEC_"):
+                kwargs["vector"].merge_stream(partPath)
+            else:
+                with open(partPath, "r", encoding="utf-8") as PH:
+                    shutil.copyfileobj(PH, kwargs["OH"], COPY_BUFFER_SIZE)
+            os.remove(partPath)
         self._post_join(**kwargs)
 
+    def _post_join(self, **kwargs):
+        """Wraps up after joining.
+
+        As KJoiner._post_join, but writing the AbundanceVector files in
+        parallel.
+
+        Arguments:
+                **kwargs {dict} -- join function keyword arguments
+        """
+        if not self.mode.name.startswith("VEC_"):
+            super()._post_join(**kwargs)
+        else:
+            kwargs["vector"].write_to(kwargs["OH"], self.threads)
+
+    @staticmethod
+    def join_part(mode, batches, outpath):
+        """Join a partition of SequenceCount batches.
+
+        In VEC_ modes, the abundance counts are streamed to the output file
+        (see AbundanceVectorStream).
+
+        Arguments:
+                mode {KJoiner.MODE} -- join mode
+                batches {list} -- list of SequenceCount Batches
+                outpath {str} -- path to output file
+        """
+        joiner = KJoiner(mode)
+        if mode.name.startswith("VEC_"):
+            vector = AbundanceVectorStream(outpath)
+            SeqCountBatcher.join_batches(
+                batches, joiner.join_function, OH=outpath, vector=vector
+            )
+            vector.flush()
+            return
+        kwargs = joiner._pre_join(outpath)
+        SeqCountBatcher.join_batches(batches, joiner.join_function, **kwargs)
+        joiner._post_join(**kwargs)
+
     def join(self, batches, outpath):
         """Join batches.
 
@@ -448,10 +734,14 @@ class SeqCountBatcher(BatcherThreading):
     Variables:
             _type {type} -- Batch record type
             __doSort {bool} -- whether to perform sorting while batching
+            __n_parts {int} -- number of sequence ranges to partition into
+            __parts {list} -- non-empty Batches of each partition
     """
 
     _type = SequenceCount
     __doSort = False
+    __n_parts = 1
+    __parts: List[List[BatchAppendable]]
 
     def __init__(self, n_batches=10, threads=1, size=None, natype=None, tmp=None):
         """Initialize SeqCountBatcher instance.
@@ -466,6 +756,7 @@ class SeqCountBatcher(BatcherThreading):
         """
         super().__init__(threads, size, natype, tmp)
         self.n_batches = n_batches
+        self.__parts = []
 
     @property
     def doSort(self):
@@ -473,61 +764,115 @@ class SeqCountBatcher(BatcherThreading):
 
     @doSort.setter
     def doSort(self, doSort):
-        assert type(True) == type(doSort)
+        assert isinstance(doSort, bool)
         self.__doSort = doSort
 
+    @property
+    def n_parts(self):
+        return self.__n_parts
+
+    @n_parts.setter
+    def n_parts(self, n_parts):
+        assert isinstance(n_parts, int)
+        assert n_parts >= 1
+        self.__n_parts = n_parts
+
+    @property
+    def parts(self):
+        return self.__parts
+
+    @property
+    def splitters(self):
+        """Sequences splitting the partitions.
+
+        Partitions are split at evenly spaced nucleotide prefixes, long enough
+        for there to be at least as many prefixes as partitions. Any sequence
+        belongs to the partition of index bisect_right(splitters, seq).
+
+        Returns:
+                list -- n_parts-1 sorted prefixes
+        """
+        p = 0
+        while (1 << (2 * p)) < self.n_parts:
+            p += 1
+        prefixes = ["".join(prefix) for prefix in product("ACGT", repeat=p)]
+        return [
+            prefixes[(i * len(prefixes)) // self.n_parts]
+            for i in range(1, self.n_parts)
+        ]
+
     def do(self, recordBatch):
         """Start batching the records.
 
         Batch seq.Sequence sub-class batch.Batch records into seq.SequenceCounts
-        batch.Batch instances.
+        batch.Batch instances, one per partition.
 
         Arguments:
                 recordBatch {list} -- list of Batches
         """
-        batchList = [
-            recordBatch[i : min(len(recordBatch), i + self.n_batches)]
-            for i in range(0, len(recordBatch), self.n_batches)
-        ]
+        records = iter(recordBatch)
+        batchList = iter(lambda: list(islice(records, self.n_batches)), [])
+        splitters = self.splitters
         batches = Parallel(n_jobs=self.threads, verbose=11)(
             delayed(SeqCountBatcher.build_batch)(
-                batchedRecords, self.type, self.tmp, self.doSort
+                batchedRecords, self.type, self.tmp, self.doSort, splitters
             )
             for batchedRecords in batchList
         )
-        self.feed_collection(batches, self.FEED_MODE.REPLACE)
+        self.__parts = [
+            [b for b in part if 0 != b.current_size] for part in zip(*batches)
+        ]
+        self.feed_collection(list(chain(*self.__parts)), self.FEED_MODE.REPLACE)
 
     @staticmethod
-    def build_batch(recordBatchList, recordType, tmpDir, doSort=False):
-        """Builds a Batch.
+    def build_batch(recordBatchList, recordType, tmpDir, doSort=False, splitters=None):
+        """Builds a Batch per partition.
 
         Arguments:
                 recordBatchList {list} -- list of Batches
                 recordType {class} -- batch record type
                 tmpDir {str} -- path to temporary directory
 
+        Keyword Arguments:
+                doSort {bool} -- whether batches need to be sorted
+                                 (default: {False})
+                splitters {list} -- sequences splitting the partitions
+                                    (default: {None})
+
         Returns:
-                Batch
+                list -- Batches, one per partition (possibly empty)
         """
         crawling = Crawler()
         crawling.doSort = doSort
         crawling.doSmart = True
         crawling.verbose = False
+        if splitters is None:
+            splitters = []
 
         batch_size = max(crawling.count_records(recordBatchList), 1)
-        batch = BatchAppendable(recordType, tmpDir, batch_size)
-        batch.isFasta = False
-        batch.suffix = ".txt"
-        batch.fwrite = "as_text"
-        batch.add_all(
-            (
-                SequenceCount(seq, headers)
-                for (headers, seq) in crawling.do_batch(recordBatchList)
-            )
-        )
-        batch.write()
-
-        return batch
+        batches = []
+        for i in range(len(splitters) + 1):
+            batch = BatchAppendable(recordType, tmpDir, batch_size)
+            batch.isFasta = False
+            batch.suffix = ".txt"
+            batch.fwrite = "as_text"
+            batches.append(batch)
+
+        # Records are formatted directly, and appended to the batches in chunks
+        as_text = SequenceCount.text_from_tuple
+        chunks: List[List[str]] = [[] for batch in batches]
+        for headers, seq in crawling.do_batch(recordBatchList):
+            part = bisect_right(splitters, seq)
+            chunks[part].append(as_text(seq, headers))
+            if JOIN_CHUNK_SIZE == len(chunks[part]):
+                batches[part].add_lines(chunks[part])
+                chunks[part].clear()
+        for batch, chunk in zip(batches, chunks):
+            if 0 != len(chunk):
+                batch.add_lines(chunk)
+            batch.write()
+
+        return batches
 
     def join(self, fjoin, **kwargs):
         """Joins SequenceCount batches.
@@ -539,11 +884,45 @@ class SeqCountBatcher(BatcherThreading):
         crawler = Crawler()
         crawler.doSmart = True
         crawler.desc = "Final joining..."
-        for headers, seq in crawler.do_batch(self.collection):
-            headers = list(chain(*headers))
-            fjoin(headers, seq, **kwargs)
+        flatten_headers = SeqCountBatcher.flatten_headers
+        for headers, seq in crawler.do_batch_prefetched(
+            self.collection, 4 * self.threads
+        ):
+            fjoin(flatten_headers(headers), seq, **kwargs)
+
+    @staticmethod
+    def join_batches(batches, fjoin, **kwargs):
+        """Joins SequenceCount batches, without progress bar.
+
+        Arguments:
+                batches {list} -- list of SequenceCount Batches
+                fjoin {function} -- join function
+                **kwargs {dict} -- join function keyword arguments
+        """
+        crawler = Crawler()
+        crawler.doSmart = True
+        crawler.verbose = False
+        flatten_headers = SeqCountBatcher.flatten_headers
+        for headers, seq in crawler.do_batch(batches):
+            fjoin(flatten_headers(headers), seq, **kwargs)
+
+    @staticmethod
+    def flatten_headers(headers):
+        """Concatenate the header lists of a group of SequenceCount records.
+
+        A group of a single record keeps its own list, without copying it.
+
+        Arguments:
+                headers {list} -- list of header lists
+
+        Returns:
+                list -- headers
+        """
+        if 1 == len(headers):
+            return headers[0]
+        return list(chain.from_iterable(headers))
 
     @staticmethod
     def from_parent(parent, n_batches):
-        assert KJoinerThreading == type(parent)
+        assert isinstance(parent, KJoinerThreading)
         return SeqCountBatcher(n_batches, parent.threads, tmp=parent.tmp)
@@ -4,9 +4,11 @@
 """
 
 import argparse
-import gzip
+from joblib import Parallel, delayed  # type: ignore
 from kman.asserts import enable_rich_assert
 from kman.batcher import BatcherThreading, FastaBatcher
+from kman.const import COPY_BUFFER_SIZE
+from kman.io import gzip_module
 from kman.scripts import arguments as ap
 import logging
 import os
@@ -114,20 +116,24 @@ def parse_arguments(args: argparse.Namespace) -> argparse.Namespace:
     return args
 
 
+def compress_batch(path: str, outdir: str) -> None:
+    """Gzip a batch file into a folder."""
+    gzname = os.path.join(outdir, f"{os.path.basename(path)}.gz")
+    with gzip_module.open(gzname, "wb") as OH, open(path, "rb") as IH:
+        shutil.copyfileobj(IH, OH, COPY_BUFFER_SIZE)
+
+
 def run_batching(args: argparse.Namespace, batcher: FastaBatcher) -> None:
-    batchList = tqdm([b for b in batcher.collection if os.path.isfile(b.tmp)])
+    batchList = [
+        b.tmp for b in batcher.collection if b.is_written and os.path.isfile(b.tmp)
+    ]
     if args.do_compress:
-        for b in batchList:
-            gzname = os.path.join(args.o, f"{os.path.basename(b.tmp)}.gz")
-            OH = gzip.open(gzname, "wb")
-            IH = open(b.tmp, "rb")
-            for line in IH:
-                OH.write(line)
-            IH.close()
-            OH.close()
+        Parallel(n_jobs=args.t, backend="threading", verbose=11)(
+            delayed(compress_batch)(path, args.o) for path in batchList
+        )
     else:
-        for b in batchList:
-            shutil.copy(b.tmp, args.o)
+        for path in tqdm(batchList):
+            shutil.copy(path, args.o)
 
 
 @enable_rich_assert
@@ -6,6 +6,8 @@
 import argparse
 from kman.asserts import enable_rich_assert
 from kman.batcher import BatcherThreading, FastaBatcher
+from kman.const import VECTOR_COMPRESS_LEVEL
+from kman.io import GZIP_LEVELS
 from kman.join import KJoiner, KJoinerThreading
 from kman.scripts import arguments as ap
 import logging
@@ -115,6 +117,17 @@ the specified output, after removing the extension.
         default=tempfile.gettempdir(),
         help=f'''Temporary folder path. Default: "{tempfile.gettempdir()}"''',
     )
+    advanced.add_argument(
+        "--compress-level",
+        dest="compress_level",
+        type=int,
+        default=VECTOR_COMPRESS_LEVEL,
+        choices=GZIP_LEVELS,
+        metavar="{1-9}",
+        help=f"""Gzip compression level of the output vectors, in VEC_* modes.
+        Lower levels are faster, but generate larger files.
+        Default: {VECTOR_COMPRESS_LEVEL}""",
+    )
     advanced.add_argument(
         "--resort",
         dest="do_resort",
@@ -169,6 +182,7 @@ def run(args: argparse.Namespace) -> None:
 
     joiner = KJoinerThreading(args.c, args.M)
     joiner.threads = args.t
+    joiner.compressLevel = args.compress_level
 
     joiner.batch_size = max(2, int(len(batches) / args.t))
     rlimits = resource.getrlimit(resource.RLIMIT_NOFILE)
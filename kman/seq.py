@@ -6,9 +6,10 @@
 
 from enum import Enum, unique
 import logging
+import numpy as np  # type: ignore
 import oligo_melting as om  # type: ignore
 import re
-from typing import Iterator, List
+from typing import List
 
 
 class SequenceCoords(object):
@@ -16,6 +17,7 @@ class SequenceCoords(object):
 
     Variables:
             regexp {sre.SRE_PATTERN} -- regular expression to parse input strings
+            strands {dict} -- strand label to SequenceCoords.STRAND
     """
 
     @unique
@@ -45,6 +47,7 @@ class SequenceCoords(object):
             ["^(?P<ref>.+):", "(?P<start>[0-9]+)-(?P<end>[0-9]+):(?P<strand>[\\+-])$"]
         )
     )
+    strands = {strand.label: strand for strand in STRAND}
 
     def __init__(self, ref, start, end, strand=STRAND.PLUS):
         super(SequenceCoords, self).__init__()
@@ -101,6 +104,23 @@ class SequenceCoords(object):
     def __repr__(self):
         return "%s:%d-%d:%s" % (self.ref, self.start, self.end, self.strand.label)
 
+    @staticmethod
+    def split_str(s):
+        """Split a coordinates string into its fields.
+
+        Uses plain string splitting instead of the regular expression, as it
+        is called once per header when joining.
+
+        Arguments:
+                s {str} -- input string, formatted as "ref:start-end:strand"
+
+        Returns:
+                tuple -- (ref, start, end, strand)
+        """
+        ref, span, strand = s.rsplit(":", 2)
+        start, end = span.split("-")
+        return (ref, int(start), int(end), SequenceCoords.strands[strand])
+
     @staticmethod
     def from_str(s):
         """Builds a SequenceCoords object from a string.
@@ -111,13 +131,7 @@ class SequenceCoords(object):
         Returns:
                 SequenceCoords
         """
-        ref, start, end, strand = SequenceCoords.regexp.search(s).group(
-            "ref", "start", "end", "strand"
-        )
-        strand = list(SequenceCoords.STRAND)[
-            [x.label for x in list(SequenceCoords.STRAND)].index(strand)
-        ]
-        return SequenceCoords(ref, int(start), int(end), strand)
+        return SequenceCoords(*SequenceCoords.split_str(s))
 
 
 class Sequence(om.Sequence):
@@ -132,9 +146,17 @@ class Sequence(om.Sequence):
     Variables:
             doReverseComplement {bool} -- whether to generate the reverse complement
                                           when crawling through the sequence.
+            complements {dict} -- om.NATYPES to complement translation table
+            alphabets {dict} -- om.NATYPES to table of the ASCII codes in the
+                                alphabet
     """
 
     doReverseComplement = False
+    complements = {t: str.maketrans(ab[0], ab[1]) for t, ab in om.AB_NA.items()}
+    alphabets = {
+        t: np.isin(np.arange(256), np.frombuffer(ab[0].encode(), dtype=np.uint8))
+        for t, ab in om.AB_NA.items()
+    }
 
     def __init__(self, seq, t, name=None):
         assert isinstance(t, om.NATYPES), "sequence type must be from om.NATYPES"
@@ -194,42 +216,19 @@ class Sequence(om.Sequence):
                 rc=self.doReverseComplement,
             )
 
-    @staticmethod
-    def __kmer_yielding(i, seq, prefix, k, t, offset, strand, rc) -> Iterator["KMer"]:
-        yield KMer(
-            prefix,
-            i + offset,
-            i + offset + k,
-            seq[i : i + k],
-            t,
-            strand=strand,
-        )
-
-    @staticmethod
-    def __kmer_yielding_with_rc(
-        i, seq, prefix, k, t, offset, strand, rc
-    ) -> Iterator["KMer"]:
-        yield KMer(
-            prefix,
-            i + offset,
-            i + offset + k,
-            seq[i : i + k],
-            t,
-            strand=strand,
-        )
-        yield KMer(
-            prefix,
-            i + offset,
-            i + offset + k,
-            Sequence.mkrc(seq[i : i + k], t),
-            t,
-            strand=SequenceCoords.rev(strand),
-        )
-
     @staticmethod
     def yield_kmers(seq, prefix, k, t, offset, strand, rc):
         """Extract k-mers from seq.
 
+        Everything that depends only on k and t (alphabet, strands, number of
+        windows) is resolved once before walking the sequence. The alphabet is
+        checked for all the windows at once, with numpy: a lookup table marks
+        unexpected characters, and their cumulative count tells which windows
+        contain any. When rc is True, the whole sequence is
+        reverse-complemented once, with a translation table built once per
+        nucleic acid type, and the reverse complement of each k-mer is sliced
+        from it.
+
         Arguments:
                 seq {string} -- input sequence
                 k {int} -- substring length
@@ -241,22 +240,30 @@ class Sequence(om.Sequence):
                                    shifting (default: {0})
         """
         seq = seq.upper()
-        kmer_yielder = (
-            Sequence.__kmer_yielding_with_rc if rc else Sequence.__kmer_yielding
-        )
-        for i in range(len(seq) - k + 1):
-            if not Sequence.check_ab(seq[i : i + k], om.AB_NA[t]):
+        seq_len = len(seq)
+        n_windows = max(0, seq_len - k + 1)
+        if rc:
+            rc_seq = seq.translate(Sequence.complements[t])[::-1]
+            rc_strand = SequenceCoords.rev(strand)
+
+        # Windows with characters out of the alphabet, counted all at once
+        codes = np.frombuffer(seq.encode("ascii", "replace"), dtype=np.uint8)
+        unexpected = np.cumsum(~Sequence.alphabets[t][codes])
+        unexpected = np.concatenate(([0], unexpected))
+        is_valid = (unexpected[k:] == unexpected[:n_windows]).tolist()
+
+        for i in range(n_windows):
+            kseq = seq[i : i + k]
+            if not is_valid[i]:
                 logging.warning(
-                    " ".join(
-                        [
-                            "skipped sequence with unexpected character:",
-                            seq[i : i + k],
-                        ]
-                    )
+                    " ".join(["skipped sequence with unexpected character:", kseq])
                 )
                 continue
-            for kmer in kmer_yielder(i, seq, prefix, k, t, offset, strand, rc):
-                yield kmer
+            start = i + offset
+            yield KMer(prefix, start, start + k, kseq, t, strand=strand)
+            if rc:
+                rc_kseq = rc_seq[seq_len - i - k : seq_len - i]
+                yield KMer(prefix, start, start + k, rc_kseq, t, strand=rc_strand)
 
     @staticmethod
     def kmerator(
@@ -384,6 +391,18 @@ class KMer(Sequence):
     def from_file(*args, **kwargs):
         return KMer.from_fasta(*args, **kwargs)
 
+    @staticmethod
+    def tuple_from_file(record):
+        """Reads a (seq, header) tuple from a Fasta record.
+
+        Arguments:
+                record {tuple} -- (header, seq)
+
+        Returns:
+                tuple -- (seq, header)
+        """
+        return (record[1], record[0])
+
     def as_fasta(self):
         """Fasta-like representation."""
         return ">%s\n%s\n" % (self.header, self.seq)
@@ -453,6 +472,35 @@ class SequenceCount(Sequence):
     def from_file(*args, **kwargs):
         return SequenceCount.from_text(*args, **kwargs)
 
+    @staticmethod
+    def tuple_from_file(line):
+        """Reads a (seq, headers) tuple from a line of text.
+
+        Arguments:
+                line {str} -- text line
+
+        Returns:
+                tuple -- (seq, headers)
+        """
+        seq, headers = line.strip().split("\t")
+        return (seq, headers.split(" "))
+
+    @staticmethod
+    def text_from_tuple(seq, headers):
+        """Formats a (seq, headers) tuple as a line of text.
+
+        Same output as SequenceCount(seq, headers).as_text(), without building
+        the SequenceCount.
+
+        Arguments:
+                seq {str} -- sequence
+                headers {list} -- list of headers
+
+        Returns:
+                str -- text line
+        """
+        return "%s\t%s\n" % (seq, " ".join(headers))
+
     def __repr__(self):
         return "%s\t%s" % (self.seq, " ".join(self.header))
 
@@ -0,0 +1,204 @@
+"""
+@author: Gabriele Girelli
+@contact: gigi.ga90@gmail.com
+"""
+
+import gzip
+import kman.abundance
+from kman.abundance import AbundanceVector, AbundanceVectorLocal
+from kman.abundance import AbundanceVectorStream
+import os
+
+
+def assert_fails(function, *args, **kwargs):
+    try:
+        function(*args, **kwargs)
+    except AssertionError as e:
+        return str(e)
+    else:
+        assert False, "expected an AssertionError"
+
+
+def read_vector(path):
+    with gzip.open(path, "rt") as FH:
+        header = FH.readline()
+        return header, [int(line) for line in FH]
+
+
+def test_AbundanceVector_add_count():
+    v = AbundanceVector()
+    v.add_count("chr1", "+", 3, 2, 5)
+    v.add_count("chr1", "+", 0, 1, 5)
+    v.add_count("chr1", "-", 1, 4, 5)
+    assert [1, 0, 0, 2] == v.mk_vector("chr1", "+").tolist()
+    assert [0, 4] == v.mk_vector("chr1", "-").tolist()
+
+    msg = assert_fails(v.add_count, "chr1", "+", 3, 5, 5)
+    assert "(chr1, +, 3, 5)" in msg
+    assert [1, 0, 0, 2] == v.mk_vector("chr1", "+").tolist()
+    v.add_count("chr1", "+", 3, 5, 5, replace=True)
+    assert [1, 0, 0, 5] == v.mk_vector("chr1", "+").tolist()
+    assert_fails(v.add_count, "chr1", "+", 3, 6, 5)
+
+    # Zero counts can be overwritten
+    v.add_count("chr1", "+", 10, 0, 5)
+    v.add_count("chr1", "+", 10, 7, 5)
+    assert 11 == v.mk_vector("chr1", "+").shape[0]
+    assert 7 == v.mk_vector("chr1", "+")[10]
+
+    assert_fails(v.add_count, "chr1", "+", 20, 1, 6)
+
+
+def test_AbundanceVector_add_counts():
+    v = AbundanceVector()
+    v.add_counts("chr1", "+", [5, 1], 3, 5)
+    assert [0, 3, 0, 0, 0, 3] == v.mk_vector("chr1", "+").tolist()
+
+    msg = assert_fails(v.add_counts, "chr1", "+", [2, 5, 1], 4, 5)
+    assert "(chr1, +, 5, 4)" in msg
+    msg = assert_fails(v.add_counts, "chr1", "+", [7, 8, 7], 4, 5)
+    assert "(chr1, +, 7, 4)" in msg
+
+    v.add_counts("chr1", "+", [9, 9], 0, 5)
+    v.add_counts("chr1", "+", [2, 5, 2], 4, 5, replace=True)
+    assert [0, 3, 4, 0, 0, 4, 0, 0, 0, 0] == v.mk_vector("chr1", "+").tolist()
+
+
+def test_AbundanceVector_merge():
+    v1, v2 = AbundanceVector(), AbundanceVector()
+    v1.add_counts("chr1", "+", [0, 2], 1, 5)
+    v2.add_counts("chr1", "+", [1, 6], 2, 5)
+    v2.add_count("chr2", "-", 1, 3, 5)
+    v1.merge(v2)
+    assert [1, 2, 1, 0, 0, 0, 2] == v1.mk_vector("chr1", "+").tolist()
+    assert [0, 3] == v1.mk_vector("chr2", "-").tolist()
+    assert [0, 3] == v2.mk_vector("chr2", "-").tolist()
+
+    v3 = AbundanceVector()
+    v3.add_count("chr1", "+", 6, 5, 5)
+    msg = assert_fails(v1.merge, v3)
+    assert "(chr1, +, 6, 5)" in msg
+    v1.merge(v3, replace=True)
+    assert 5 == v1.mk_vector("chr1", "+")[6]
+
+    v4 = AbundanceVector()
+    v4.add_count("chr1", "+", 0, 1, 6)
+    assert_fails(v1.merge, v4)
+
+
+def test_AbundanceVector_write_to(tmp_path):
+    v = AbundanceVector()
+    v.add_counts("chr1", "+", [0, 4], 2, 5)
+    v.add_count("chr1", "+", 2, 1 << 13, 5)
+    v.add_count("chr2", "-", 1, 1, 5)
+    v.add_ref("chr2", "-", 4)
+
+    v.write_to(str(tmp_path / "output.txt"), threads=2)
+    outdir = tmp_path / "output"
+    assert ["chr1___+.gz", "chr2___-.gz"] == sorted(os.listdir(outdir))
+    assert ("# k=5\n", [2, 0, 1 << 13, 0, 2]) == read_vector(outdir / "chr1___+.gz")
+    assert ("# k=5\n", [0, 1, 0, 0]) == read_vector(outdir / "chr2___-.gz")
+
+
+def fill_vector(v):
+    v.add_counts("chr1", "+", [4, 1], 2, 5)
+    v.add_count("chr1", "-", 7, 1, 5)
+    v.add_count("chr1", "+", 0, 0, 5)
+    v.add_count("chr1", "+", 0, 3, 5)
+    v.add_count("chr2", "+", 2, 1 << 13, 5)
+    v.add_count("chr1", "+", 4, 5, 5, replace=True)
+    v.add_counts("chr1", "+", [9, 12], 1, 5)
+    v.add_count("chr1", "+", 9, 6, 5, replace=True)
+    v.add_count("chr1", "-", 2, 2, 5)
+
+
+def read_output(dirpath):
+    return {
+        fname: read_vector(os.path.join(dirpath, fname))
+        for fname in sorted(os.listdir(dirpath))
+    }
+
+
+def test_AbundanceVectorLocal(tmp_path, monkeypatch):
+    v = AbundanceVector()
+    fill_vector(v)
+    v.write_to(str(tmp_path / "normal"))
+    expected = read_output(tmp_path / "normal")
+    assert [3, 2, 0, 0, 5, 0, 0, 0, 0, 6, 0, 0, 1] == expected["chr1___+.gz"][1]
+
+    for size in [1, 2, 3, 4, 1 << 20]:
+        monkeypatch.setattr(kman.abundance, "VECTOR_FLUSH_SIZE", size)
+        vl = AbundanceVectorLocal()
+        fill_vector(vl)
+        vl.write_to(str(tmp_path / f"local_{size}"))
+        assert expected == read_output(tmp_path / f"local_{size}"), size
+
+
+def test_AbundanceVectorLocal_replace(tmp_path, monkeypatch):
+    for size in [1, 2, 1 << 20]:
+        monkeypatch.setattr(kman.abundance, "VECTOR_FLUSH_SIZE", size)
+
+        def overwrite():
+            vl = AbundanceVectorLocal()
+            vl.add_count("chr1", "+", 3, 1, 5)
+            vl.add_count("chr1", "+", 5, 1, 5)
+            vl.add_count("chr1", "+", 3, 2, 5)
+            vl.flush()
+
+        msg = assert_fails(overwrite)
+        assert "(chr1, +, 3, 2)" in msg
+
+        vl = AbundanceVectorLocal()
+        vl.add_count("chr1", "+", 3, 1, 5)
+        vl.add_count("chr1", "+", 3, 2, 5, replace=True)
+        vl.add_count("chr1", "+", 4, 2, 5)
+        vl.flush()
+        vl.add_count("chr1", "+", 4, 7, 5, replace=True)
+        vl.write_to(str(tmp_path / f"local_{size}"))
+        output = read_vector(tmp_path / f"local_{size}" / "chr1___+.gz")
+        assert [0, 0, 0, 2, 7] == output[1]
+
+
+def test_AbundanceVectorStream(tmp_path, monkeypatch):
+    v = AbundanceVector()
+    fill_vector(v)
+    for size in [1, 2, 3, 1 << 20]:
+        monkeypatch.setattr(kman.abundance, "VECTOR_FLUSH_SIZE", size)
+        vs = AbundanceVectorStream(str(tmp_path / f"stream_{size}"))
+        fill_vector(vs)
+        vs.flush()
+        merged = AbundanceVector()
+        merged.merge_stream(vs.path)
+        for ref, strand in [("chr1", "+"), ("chr1", "-"), ("chr2", "+")]:
+            expected = v.mk_vector(ref, strand).tolist()
+            assert expected == merged.mk_vector(ref, strand).tolist(), size
+
+    vs = AbundanceVectorStream(str(tmp_path / "stream"))
+    vs.add_count("chr1", "+", 3, 1, 5)
+    vs.add_counts("chr1", "+", [5, 3], 2, 5)
+    vs.flush()
+    msg = assert_fails(AbundanceVector().merge_stream, vs.path)
+    assert "(chr1, +, 3, 2)" in msg
+
+    empty = AbundanceVectorStream(str(tmp_path / "empty"))
+    empty.flush()
+    merged = AbundanceVector()
+    merged.merge_stream(empty.path)
+    merged.add_count("chr1", "+", 3, 4, 5)
+    merged.merge_stream(str(tmp_path / f"stream_{1 << 20}"))
+    assert 4 == merged.mk_vector("chr1", "+")[3]
+    assert_fails(merged.merge_stream, vs.path)
+
+
+def test_AbundanceVectorLocal_sparse(tmp_path):
+    vl = AbundanceVectorLocal()
+    vl.add_counts("chr1", "+", [1 << 16, 2, 1 << 16], 3, 5, replace=True)
+    vl.add_count("chr1", "+", 7, 1, 5)
+    vl.flush()
+    vl.add_count("chr1", "+", (1 << 16) - 1, 2, 5)
+    vl.write_to(str(tmp_path / "local"))
+    output = read_vector(tmp_path / "local" / "chr1___+.gz")[1]
+    assert (1 << 16) + 1 == len(output)
+    assert {2: 3, 7: 1, (1 << 16) - 1: 2, 1 << 16: 3} == {
+        i: count for i, count in enumerate(output) if 0 != count
+    }
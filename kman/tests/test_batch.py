@@ -3,7 +3,9 @@
 @contact: gigi.ga90@gmail.com
 """
 
+import kman.batch
 from kman.batch import Batch, BatchAppendable
+from kman.seq import KMer, SequenceCoords, SequenceCount
 import os
 
 
@@ -172,3 +174,75 @@ def test_BatchAppendable():
     assert 5 == b.remaining
     assert b.is_written
     assert not os.path.isfile(b.tmp)
+
+
+def test_Batch_tuple_gen_KMer(tmp_path):
+    kmers = [
+        KMer("chr1", 10, 15, "TTACG"),
+        KMer("chr2", 0, 5, "AAACG", strand=SequenceCoords.STRAND.MINUS),
+        KMer("chr1", 3, 8, "TTACG"),
+    ]
+    expected = [(k.seq, k.header) for k in kmers]
+    assert ("TTACG", "chr1:10-15:+") == expected[0]
+
+    for batchType in [Batch, BatchAppendable]:
+        b = batchType(KMer, str(tmp_path), 3)
+        for kmer in kmers:
+            b.add(kmer)
+        assert expected == list(b.tuple_gen())
+        b.write()
+        assert b.is_written
+        assert expected == list(b.tuple_gen())
+        assert expected == list(b.tuple_gen(smart=True))
+        assert expected == [KMer.tuple_from_file(r[::-1]) for r in expected]
+
+        b2 = batchType.from_file(b.tmp, KMer)
+        assert expected == list(b2.tuple_gen())
+
+
+def test_Batch_tuple_gen_SequenceCount(tmp_path):
+    counts = [
+        SequenceCount("TTACG", ["chr1:10-15:+", "chr1:3-8:+"]),
+        SequenceCount("AAACG", ["chr2:0-5:-"]),
+    ]
+    expected = [(c.seq, c.header) for c in counts]
+
+    b = BatchAppendable(SequenceCount, str(tmp_path), 2)
+    b.isFasta = False
+    b.suffix = ".txt"
+    b.fwrite = "as_text"
+    b.add_lines([SequenceCount.text_from_tuple(*t) for t in expected])
+    assert b.is_written
+    assert expected == list(b.tuple_gen())
+    assert expected == [SequenceCount.tuple_from_file(c.as_text()) for c in counts]
+
+    b2 = BatchAppendable.from_file(b.tmp, SequenceCount, isFasta=False)
+    b2.isFasta = False
+    assert expected == list(b2.tuple_gen())
+    assert [c.as_text() for c in counts] == [r.as_text() for r in b2.record_gen()]
+
+
+def test_BatchAppendable_add_all_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(kman.batch, "JOIN_CHUNK_SIZE", 2)
+    b = BatchAppendable(str, str(tmp_path), 6)
+    b.isFasta = False
+    b.fwrite = "__str__"
+    b.fread = "__str__"
+
+    chunks = []
+    add_lines = b.add_lines
+    monkeypatch.setattr(
+        b, "add_lines", lambda lines: chunks.append(lines) or add_lines(lines)
+    )
+    records = [f"record {i}" for i in range(5)]
+    b.add_all(iter(records))
+    assert [2, 2, 1] == [len(lines) for lines in chunks]
+    assert 5 == b.current_size
+    assert records == [r.strip() for r in b.record_gen()]
+
+    try:
+        b.add_all(["sixth", "seventh"])
+    except AssertionError:
+        pass
+    else:
+        assert False, "records beyond the batch size must be reported"
@@ -0,0 +1,216 @@
+"""
+@author: Gabriele Girelli
+@contact: gigi.ga90@gmail.com
+"""
+
+from Bio.SeqIO.FastaIO import SimpleFastaParser  # type: ignore
+import gzip
+import io
+from joblib import Parallel, delayed  # type: ignore
+import kman.io
+from kman.const import FASTA_BLOCK_SIZE
+from kman.io import count_fasta_records, gzip_module_level, gzip_writer
+from kman.io import GZIP_LEVELS, SmartFastaParser
+
+
+def write_fasta(path, content):
+    with open(path, "wb") as OH:
+        OH.write(content)
+    return str(path)
+
+
+def open_parsers():
+    return SmartFastaParser._SmartFastaParser__open_parsers
+
+
+def test_SmartFastaParser_abandoned(tmp_path):
+    path = write_fasta(tmp_path / "test.fa", b">r1\nACGT\n>r2\nTTTT\n")
+
+    parser = SmartFastaParser(path)
+    records = parser.parse()
+    assert ("r1", "ACGT") == next(records)
+    assert parser in open_parsers()
+    records.close()
+    assert parser not in open_parsers()
+    assert parser._SmartFastaParser__FH.closed
+
+
+def test_SmartFastaParser_threads(tmp_path):
+    paths = [
+        write_fasta(
+            tmp_path / f"test_{i}.fa",
+            b"".join(b">r%d_%d\n%s\n" % (i, j, b"ACGT" * (i + j)) for j in range(50)),
+        )
+        for i in range(8)
+    ]
+
+    expected = [list(SmartFastaParser(path).parse()) for path in paths]
+    assert expected == Parallel(n_jobs=4, backend="threading")(
+        delayed(list)(SmartFastaParser(path).parse()) for path in paths
+    )
+    assert 0 == len(open_parsers())
+
+
+def simple_parse(content):
+    with io.StringIO(content.decode()) as FH:
+        return [(title, seq.replace("\r", "")) for title, seq in SimpleFastaParser(FH)]
+
+
+FASTA = b"".join(
+    [
+        b">r1 first record\nACGTACGTAC\nGTACG\n",
+        b">r2\n\nTTTT\n",
+        b">r3\nA\n",
+        b">r4 last\nGGGGCCCCAAAATTTT\nACGT\n",
+    ]
+)
+
+
+def test_SmartFastaParser_blocks(tmp_path, monkeypatch):
+    path = write_fasta(tmp_path / "test.fa", FASTA)
+    expected = simple_parse(FASTA)
+    assert expected == list(SmartFastaParser(path).parse())
+    for size in range(1, len(FASTA) + 2):
+        monkeypatch.setattr(kman.io, "FASTA_BLOCK_SIZE", size)
+        assert expected == list(SmartFastaParser(path).parse()), size
+
+
+def test_SmartFastaParser_block_spanning_record(tmp_path):
+    seq = b"ACGT" * (FASTA_BLOCK_SIZE // 2)
+    content = b">r1\n" + seq + b"\n>r2\nACGT\n"
+    path = write_fasta(tmp_path / "test.fa", content)
+    assert [("r1", seq.decode()), ("r2", "ACGT")] == list(
+        SmartFastaParser(path).parse()
+    )
+
+
+def test_SmartFastaParser_block_starting_record(tmp_path, monkeypatch):
+    content = b">r1\nACG\n>r2\nTT\n"
+    assert b">" == content[8:9]
+    path = write_fasta(tmp_path / "test.fa", content)
+    monkeypatch.setattr(kman.io, "FASTA_BLOCK_SIZE", 8)
+    assert [("r1", "ACG"), ("r2", "TT")] == list(SmartFastaParser(path).parse())
+
+
+def test_SmartFastaParser_leading_text(tmp_path, monkeypatch):
+    content = b"\n\n; comment line\nnot a record > either\n" + FASTA
+    path = write_fasta(tmp_path / "test.fa", content)
+    expected = simple_parse(content)
+    assert expected == simple_parse(FASTA)
+    for size in [1, 3, 8, FASTA_BLOCK_SIZE]:
+        monkeypatch.setattr(kman.io, "FASTA_BLOCK_SIZE", size)
+        assert expected == list(SmartFastaParser(path).parse()), size
+
+
+def test_SmartFastaParser_crlf(tmp_path, monkeypatch):
+    content = FASTA.replace(b"\n", b"\r\n")
+    path = write_fasta(tmp_path / "test.fa", content)
+    expected = simple_parse(FASTA)
+    for size in [1, 5, FASTA_BLOCK_SIZE]:
+        monkeypatch.setattr(kman.io, "FASTA_BLOCK_SIZE", size)
+        assert expected == list(SmartFastaParser(path).parse()), size
+
+
+def test_SmartFastaParser_empty(tmp_path):
+    for content in [b"", b"\n\n; only comments\n"]:
+        path = write_fasta(tmp_path / "test.fa", content)
+        parser = SmartFastaParser(path)
+        try:
+            list(parser.parse())
+        except AssertionError:
+            pass
+        else:
+            assert False, "empty files must be reported"
+        assert parser not in open_parsers()
+
+
+def test_SmartFastaParser_gzip(tmp_path, monkeypatch):
+    path = str(tmp_path / "test.fa.gz")
+    with gzip.open(path, "wb") as OH:
+        OH.write(FASTA)
+    expected = simple_parse(FASTA)
+    for size in [3, FASTA_BLOCK_SIZE]:
+        monkeypatch.setattr(kman.io, "FASTA_BLOCK_SIZE", size)
+        assert expected == list(SmartFastaParser(path).parse())
+    with gzip.open(path, "rb") as FH:
+        assert expected == list(SmartFastaParser(FH).parse())
+
+
+def test_SmartFastaParser_eviction(tmp_path, monkeypatch):
+    monkeypatch.setattr(kman.io, "FASTA_BLOCK_SIZE", 4)
+    monkeypatch.setattr(kman.io, "MAX_OPEN_FASTA", 2)
+    paths = [write_fasta(tmp_path / f"test_{i}.fa", FASTA) for i in range(4)]
+    paths.append(str(tmp_path / "test.fa.gz"))
+    with gzip.open(paths[-1], "wb") as OH:
+        OH.write(FASTA)
+
+    parsers = [SmartFastaParser(path) for path in paths]
+    generators = [parser.parse() for parser in parsers]
+    output = [[] for path in paths]
+    for _ in range(len(simple_parse(FASTA))):
+        for i, records in enumerate(generators):
+            output[i].append(next(records))
+            assert len(open_parsers()) <= 2
+    assert 0 != sum(parser._SmartFastaParser__FH.closed for parser in parsers)
+
+    for i, records in enumerate(generators):
+        output[i].extend(records)
+        assert simple_parse(FASTA) == output[i]
+    assert 0 == len(open_parsers())
+
+
+def test_count_fasta_records(tmp_path, monkeypatch):
+    contents = [
+        FASTA,
+        b"\n\n; comment line\nnot a record > either\n" + FASTA,
+        FASTA.replace(b"\n", b"\r\n"),
+        b">r1\nACGT",
+        b"; only comments\n",
+        b"",
+    ]
+    for content in contents:
+        path = write_fasta(tmp_path / "test.fa", content)
+        gzpath = str(tmp_path / "test.fa.gz")
+        with gzip.open(gzpath, "wb") as OH:
+            OH.write(content)
+        expected = len(simple_parse(content))
+        for size in range(1, len(content) + 2):
+            monkeypatch.setattr(kman.io, "FASTA_BLOCK_SIZE", size)
+            assert expected == count_fasta_records(path), (content, size)
+            assert expected == count_fasta_records(gzpath), (content, size)
+
+
+def test_count_fasta_records_block_boundary(tmp_path, monkeypatch):
+    content = b">r1\nACG\n>r2\nTT\n>r3\nA\n"
+    path = write_fasta(tmp_path / "test.fa", content)
+    monkeypatch.setattr(kman.io, "FASTA_BLOCK_SIZE", 8)
+    assert b"\n" == content[7:8] and b">" == content[8:9]
+    assert 3 == count_fasta_records(path)
+    monkeypatch.setattr(kman.io, "FASTA_BLOCK_SIZE", 9)
+    assert 3 == count_fasta_records(path)
+
+
+def test_gzip_module_level(monkeypatch):
+    for levels in [range(1, 10), range(0, 4)]:
+        monkeypatch.setattr(kman.io, "GZIP_MODULE_LEVELS", levels)
+        converted = [gzip_module_level(level) for level in GZIP_LEVELS]
+        assert converted == sorted(converted)
+        assert [levels[0], levels[-1]] == [converted[0], converted[-1]]
+        assert set(levels) == set(converted)
+    for level in [0, 10]:
+        try:
+            gzip_module_level(level)
+        except AssertionError:
+            pass
+        else:
+            assert False, "levels out of [1, 9] must be reported"
+
+
+def test_gzip_writer_in_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(kman.io.shutil, "which", lambda name: None)
+    for level in GZIP_LEVELS:
+        path = str(tmp_path / f"test_{level}.gz")
+        with gzip_writer(path, level) as OH:
+            OH.write(FASTA)
+        with gzip.open(path, "rb") as FH:
+            assert FASTA == FH.read()
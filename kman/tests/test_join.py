@@ -0,0 +1,166 @@
+"""
+@author: Gabriele Girelli
+@contact: gigi.ga90@gmail.com
+"""
+
+import gzip
+from kman.batcher import FastaBatcher
+import kman.join
+from kman.join import Crawler, KJoiner, KJoinerThreading
+import numpy as np  # type: ignore
+import os
+import shutil
+import threading
+
+
+def mk_batches(tmp_path, k=5, size=40, rc=False):
+    rng = np.random.default_rng(1)
+    repeat = "".join(rng.choice(list("ACGT"), 40))
+    path = tmp_path / "input.fa"
+    with open(path, "w") as OH:
+        for i in range(6):
+            seq = "".join(rng.choice(list("ACGT"), 60))
+            OH.write(f">r{i} desc\n{seq[:30]}{repeat}{seq[30:]}\n")
+    batcher = FastaBatcher(size=size, threads=1)
+    batcher.doReverseComplement = rc
+    batcher.do(str(path), k)
+    return batcher
+
+
+def test_Crawler_do_batch_prefetched(tmp_path, monkeypatch):
+    monkeypatch.setattr(kman.join, "JOIN_CHUNK_SIZE", 2)
+    batcher = mk_batches(tmp_path)
+    batches = batcher.collection
+    crawler = Crawler()
+    crawler.verbose = False
+    expected = list(crawler.do_batch(batches))
+    assert expected == list(crawler.do_batch_prefetched(batches, maxsize=1))
+
+    nthreads = threading.active_count()
+    groups = crawler.do_batch_prefetched(batches, maxsize=1)
+    assert expected[:3] == [next(groups) for _ in range(3)]
+    groups.close()
+    assert nthreads == threading.active_count()
+
+    def failing(batches):
+        yield from expected[:4]
+        raise ValueError("reader failed")
+
+    crawler.do_batch = failing
+    groups = crawler.do_batch_prefetched(batches, maxsize=1)
+    assert expected[:4] == [next(groups) for _ in range(4)]
+    try:
+        next(groups)
+    except ValueError as e:
+        assert "reader failed" == str(e)
+    else:
+        assert False, "reader errors must be raised"
+    assert nthreads == threading.active_count()
+
+
+def sorted_groups(groups):
+    return [(sorted(headers), seq) for headers, seq in groups]
+
+
+def test_Crawler_do_batch_in_memory(tmp_path):
+    for k in [5, 35]:
+        for rc in [False, True]:
+            batcher = mk_batches(tmp_path, k=k, rc=rc)
+            crawler = Crawler()
+            crawler.verbose = False
+            expected = sorted_groups(crawler.do_batch(batcher.collection))
+            assert any(1 < len(headers) for headers, seq in expected)
+            assert all(k == len(seq) for headers, seq in expected)
+            assert expected == sorted_groups(
+                crawler.do_batch_in_memory(batcher.collection)
+            )
+
+
+def test_Crawler_encode_seqs():
+    rng = np.random.default_rng(2)
+    for k in [1, 5, 31, 32]:
+        seqs = ["".join(rng.choice(list("ACGT"), k)) for i in range(200)]
+        seqs.extend(seqs[:20])
+        keys = Crawler.encode_seqs(np.array(seqs, dtype=bytes))
+        assert np.uint64 == keys.dtype
+        assert sorted(seqs) == [seqs[i] for i in np.argsort(keys, kind="stable")]
+        assert len(set(seqs)) == len(set(keys.tolist()))
+
+    for seqs in [
+        ["ACGTN", "ACGTA"],
+        ["acgta", "ACGTA"],
+        ["ACGT", "ACGTA"],
+        ["A" * 33, "C" * 33],
+    ]:
+        seqs = np.array(seqs, dtype=bytes)
+        assert seqs is Crawler.encode_seqs(seqs)
+
+
+def read_output(path, mode):
+    if mode.name.startswith("VEC_"):
+        dirpath = os.path.splitext(path)[0]
+        output = {}
+        for fname in sorted(os.listdir(dirpath)):
+            with gzip.open(os.path.join(dirpath, fname), "rb") as FH:
+                output[fname] = FH.read()
+        return output
+    with open(path, "rb") as FH:
+        return FH.read()
+
+
+def test_KJoinerThreading_parallel(tmp_path, monkeypatch):
+    monkeypatch.setattr(kman.join.mp, "cpu_count", lambda: 4)
+    for rc in [False, True]:
+        batcher = mk_batches(tmp_path, rc=rc)
+        for batches in [batcher.collection, []]:
+            for mode in KJoiner.MODE:
+                outputs = []
+                for threads in [1, 3]:
+                    joiner = KJoinerThreading(mode)
+                    joiner.threads = threads
+                    joiner.batch_size = 7
+                    assert threads == joiner.threads
+                    path = str(tmp_path / f"{mode.name}_{rc}_{threads}.txt")
+                    if os.path.isdir(os.path.splitext(path)[0]):
+                        shutil.rmtree(os.path.splitext(path)[0])
+                    joiner.join(batches, path)
+                    outputs.append(read_output(path, mode))
+                assert outputs[0] == outputs[1], (mode, rc, len(batches))
+                assert (0 == len(batches)) == (0 == len(outputs[0]))
+
+
+def test_KJoiner_compressLevel(tmp_path):
+    joiner = KJoiner(KJoiner.MODE.VEC_COUNT)
+    assert 9 == joiner.compressLevel
+    assert 9 == joiner._pre_join(str(tmp_path / "output.txt"))["vector"]._compressLevel
+    for memory in KJoiner.MEMORY:
+        joiner.memory = memory
+        joiner.compressLevel = 1
+        vector = joiner._pre_join(str(tmp_path / "output.txt"))["vector"]
+        assert 1 == vector._compressLevel
+
+
+def test_KJoiner_join_in_memory(tmp_path, monkeypatch):
+    batcher = mk_batches(tmp_path)
+    batches = batcher.collection
+    crawler = Crawler()
+    written = [batch.tmp for batch in batches if batch.is_written]
+    assert 0 < len(written)
+    assert sum(os.path.getsize(p) for p in written) == crawler.count_bytes(batches)
+
+    in_memory = Crawler.do_batch_in_memory
+    for mode in KJoiner.MODE:
+        outputs = []
+        for maxBytes in [-1, 1 << 26]:
+            monkeypatch.setattr(kman.join, "NUMPY_JOIN_MAX_BYTES", maxBytes)
+            calls = []
+            monkeypatch.setattr(
+                Crawler,
+                "do_batch_in_memory",
+                lambda self, b: calls.append(b) or in_memory(self, b),
+            )
+            path = str(tmp_path / f"{mode.name}_{maxBytes}.txt")
+            KJoiner(mode).join(batches, path)
+            assert (0 < maxBytes) == (1 == len(calls))
+            outputs.append(read_output(path, mode))
+        assert outputs[0] == outputs[1], mode
@@ -198,3 +198,40 @@ def test_SequenceCount():
     assert str(sco) == strRepr
     assert sco == sco.from_text(strRepr)
     assert str(sco) + "\n" == sco.as_text()
+
+
+def check_ab_kmers(seq, k, t, rc):
+    """K-mers of seq, checking the alphabet of each of them with check_ab."""
+    seq = seq.upper()
+    ab = om.AB_NA[t]
+    minus = SequenceCoords.STRAND.MINUS
+    kmers = []
+    for i in range(len(seq) - k + 1):
+        kseq = seq[i : i + k]
+        if Sequence.check_ab(kseq, ab):
+            kmers.append(KMer("ref", i, i + k, kseq, t))
+            if rc:
+                rc_kseq = kseq.translate(str.maketrans(ab[0], ab[1]))[::-1]
+                kmers.append(KMer("ref", i, i + k, rc_kseq, t, strand=minus))
+    return [(kmer.header, kmer.seq) for kmer in kmers]
+
+
+def test_Sequence_yield_kmers_alphabet():
+    cases = [
+        ("NACGTACGT", om.NATYPES.DNA),
+        ("ACGTACGTN", om.NATYPES.DNA),
+        ("ACGNTACGNT", om.NATYPES.DNA),
+        ("acgtNacgtac", om.NATYPES.DNA),
+        ("ACGUACGUT", om.NATYPES.RNA),
+        ("ACGTÄACGTé", om.NATYPES.DNA),
+        ("ACGßACGT", om.NATYPES.DNA),
+        ("ACGT", om.NATYPES.DNA),
+        ("", om.NATYPES.DNA),
+    ]
+    strand = SequenceCoords.STRAND.PLUS
+    for seq, t in cases:
+        for k in {1, 3, 4, 5, len(seq), len(seq) + 1} - {0}:
+            for rc in [False, True]:
+                kmers = Sequence.yield_kmers(seq, "ref", k, t, 0, strand, rc)
+                kmers = [(kmer.header, kmer.seq) for kmer in kmers]
+                assert check_ab_kmers(seq, k, t, rc) == kmers, (seq, k, rc)